@@ -1,3 +1,4 @@
 from ._path import *
 from ._annotation import *
-from ._anno_collector import *
\ No newline at end of file
+from ._anno_collector import *
+from ._coco_stream import *
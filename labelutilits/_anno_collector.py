@@ -4,6 +4,7 @@ import shutil
 from distutils.dir_util import copy_tree
 
 import numpy as np
+from itertools import chain
 
 import pandas as pd
 import json
@@ -23,6 +24,10 @@ from pycocotools.coco import COCO
 from ._annojson  import *
 from ._coco_func import *
 from ._path      import *
+from ._coco_stream import (write_coco,
+                           _iter_events,
+                           _write_events,
+                           _ARRAY_START)
 from .OLD._coco_func import _get_coco_annotations
         
 #----------------------------------------------
@@ -227,8 +232,8 @@ def _class_desc(annodf, data_desc):
     ''' Auxiliary, fill 'categories' field in the COCO json '''
     data_desc['categories'] = list()
     
-    class_ids   = list(set(sum(annodf['class_id'   ].to_list(),[])))
-    class_names = list(set(sum(annodf['class_names'].to_list(),[])))
+    class_ids   = list(set(chain.from_iterable(annodf['class_id'   ])))
+    class_names = list(set(chain.from_iterable(annodf['class_names'])))
     
     for class_id, class_name in zip(class_ids,class_names):
         data_desc['categories'] += [{'id': class_id, 'name': class_name, 'supercategory': ''}]
@@ -299,19 +304,15 @@ def create_json(annodf, project_dir = None, new_anno_name = 'annotation.json', d
     
     data_desc = _class_desc(annodf, data_desc)
 
-    new_annos  = sum(annodf['anno'].tolist(),[])
-    new_images = annodf['img_desc'].tolist()
-
-    data_desc['images']      = new_images
-    data_desc['annotations'] = new_annos
-    
     if project_dir is None:
         project_dir = os.getcwd()
     
     new_anno_path = os.path.join(project_dir,new_anno_name)
     
-    with open(new_anno_path, 'w') as f:
-        json.dump(data_desc, f)
+    # IMAGES AND ANNOTATIONS ARE STREAMED FROM annodf
+    write_coco(new_anno_path, {**data_desc, 
+                               'images': annodf['img_desc'],
+                               'annotations': chain.from_iterable(annodf['anno'])})
         
     return new_anno_path
 
@@ -352,31 +353,30 @@ def copy2train(anno_path, new_img_dir  = 'train', project_path = None, copy_anno
     new_img_dir_path = os.path.join(project_path, new_img_dir)
     create_dir(new_img_dir_path)
     
-    # IMAGE LIST TODO REPLACE WITH DATA FROM JSON?
-    with open(anno_path) as json_file:
-        data = json.load(json_file)
-    
     # COPY IMAGES, NEW PATH INCLUDE DATA DIRICTORY
-    df = pd.DataFrame() # REPORT
-    for i,img_desc in enumerate(data['images']):
-        file_path = img_desc['file_name']
-
-        file_name = os.path.split(_add_dir_descr(file_path))[-1]
-        
-        new_path  = os.path.join(new_img_dir_path,file_name)
-
-        dict_desc = {'old path':file_path, 
-                     'new path':'ALREADY EXIST',
-                     'copied': 'False',
-                     'new file name':file_name}
-
-        if not os.path.exists(new_path):
-            shutil.copyfile(file_path, new_path)
-            dict_desc['new path']   = new_path
-            dict_desc['copied']   = 'True'
-            data['images'][i]['file_name'] = new_path
-
-        df = df.append(dict_desc, ignore_index=True)
+    reports = list() # REPORT
+    def copy_images(events):
+        for key, img_desc in events:
+            if key == 'images' and img_desc is not _ARRAY_START:
+                file_path = img_desc['file_name']
+
+                file_name = os.path.split(_add_dir_descr(file_path))[-1]
+                
+                new_path  = os.path.join(new_img_dir_path,file_name)
+
+                dict_desc = {'old path':file_path, 
+                             'new path':'ALREADY EXIST',
+                             'copied': 'False',
+                             'new file name':file_name}
+
+                if not os.path.exists(new_path):
+                    shutil.copyfile(file_path, new_path)
+                    dict_desc['new path']   = new_path
+                    dict_desc['copied']   = 'True'
+                    img_desc['file_name'] = new_path
+
+                reports.append(dict_desc)
+            yield key, img_desc
     
     # COPY ANNO
     if copy_anno:
@@ -392,17 +392,15 @@ def copy2train(anno_path, new_img_dir  = 'train', project_path = None, copy_anno
             dict_desc['new path'] = new_anno_path
             dict_desc['copied'] = 'True'
 
-        df = df.append(dict_desc, ignore_index=True) 
+        df_anno = dict_desc
     else:
         new_anno_path = anno_path
     
-    # REWRITE
-#     with open(new_anno_path, 'r+') as f:
-#         data = json.load(f); f.seek(0)
-#         data['images']  = imglist
-#         json.dump(data, f); f.truncate()
-    with open(new_anno_path, 'w') as f:
-        json.dump(data, f)  
+    # REWRITE (IMAGES ARE COPIED WHILE ANNOTATION IS STREAMED,
+    # SOURCE IS REPLACED ONLY AFTER WHOLE FILE IS WRITTEN)
+    _write_events(new_anno_path, copy_images(_iter_events(anno_path)))
+    if copy_anno: reports.append(df_anno)
+    df = pd.DataFrame(reports)
         
     return df, new_anno_path
     
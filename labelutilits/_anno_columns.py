@@ -0,0 +1,439 @@
+import json
+from array import array
+import numpy as np
+
+__all__ = ['_ColumnsBuilder', '_anno2columns', '_columns2anno', '_take_columns',
+           '_anno_polygons', '_float32_exact', '_float32_list', '_empty_columns', '_columns_nbytes',
+           '_scale_columns', '_clip_columns']
+
+ANNO_KEYS = ('id', 'image_id', 'category_id', 'segmentation',
+             'area', 'bbox', 'iscrowd')
+
+FLOAT32_DIGITS = np.arange(1, 10) # SIGNIFICANT DIGITS OF SHORTEST FLOAT32 REPR
+EXACT_BLOCK    = 2**15
+
+#---------------------------------------
+class _ColumnsBuilder():
+    '''
+    Incremental builder of the columnar (struct-of-arrays)
+      store for annotations in COCO format.
+
+    Notes
+    -------
+    columns store is dict with keys:
+    * 'id', 'image_id', 'category_id': ndarray[int32] (N);
+    * 'iscrowd': ndarray[uint8] (N);
+    * 'area': ndarray[float32] (N);
+    * 'bbox': ndarray[float32] (N x 4) in format [x0,y0,w,h];
+    * 'vertices': ndarray[float32], flat buffer of all
+       polygons in format [x,y,x,y,...];
+    * 'poly_offsets': ndarray[int64] (P+1), start of each
+       polygon in vertices;
+    * 'anno_offsets': ndarray[int64] (N+1), start of each
+       annotation in poly_offsets;
+    * 'extra_index': ndarray[int32] (N), index in extras;
+    * 'extras': list[dict], unique values of other annotation
+       fields (attributes, RLE segmentation, ...);
+    * 'keys': list[string], order of annotation keys.
+    '''
+    def __init__(self):
+        self.ids          = array('i')
+        self.image_ids    = array('i')
+        self.category_ids = array('i')
+        self.iscrowd      = array('B')
+        self.area         = array('f')
+        self.bbox         = array('f')
+        self.vertices     = array('f')
+        self.poly_lengths = array('q')
+        self.anno_npolys  = array('q')
+        self.extra_index  = array('i')
+        self.extras       = list()
+        self.__extras_map = dict()
+        self.keys         = None
+
+    def append(self, ann):
+        ''' Add one annotation in COCO format.'''
+        if self.keys is None: self.keys = list(ann)
+        self.ids.append(ann['id'])
+        self.image_ids.append(ann['image_id'])
+        self.category_ids.append(ann['category_id'])
+        self.iscrowd.append(int(ann.get('iscrowd', 0)))
+        self.area.append(ann.get('area', np.nan))
+        self.bbox.extend(ann.get('bbox', (np.nan,)*4))
+
+        extra = {k:v for k,v in ann.items() if k not in ANNO_KEYS}
+        segm  = ann.get('segmentation', [])
+        if isinstance(segm, list):
+            for poly in segm:
+                self.vertices.extend(poly)
+                self.poly_lengths.append(len(poly))
+            self.anno_npolys.append(len(segm))
+        else:
+            extra['segmentation'] = segm
+            self.anno_npolys.append(0)
+
+        key = json.dumps(extra, sort_keys=True, default=str)
+        if key not in self.__extras_map:
+            self.__extras_map[key] = len(self.extras)
+            self.extras.append(extra)
+        self.extra_index.append(self.__extras_map[key])
+        return self
+
+    def extend(self, annotations):
+        ''' Add annotations in COCO format.'''
+        for ann in annotations:
+            self.append(ann)
+        return self
+
+    def columns(self):
+        ''' Return columns store as dict of arrays.'''
+        poly_offsets = np.zeros(len(self.poly_lengths) + 1, dtype=np.int64)
+        np.cumsum(np.frombuffer(self.poly_lengths, dtype=np.int64), out=poly_offsets[1:])
+        anno_offsets = np.zeros(len(self.anno_npolys) + 1, dtype=np.int64)
+        np.cumsum(np.frombuffer(self.anno_npolys, dtype=np.int64), out=anno_offsets[1:])
+        return {'id':           np.array(self.ids, dtype=np.int32),
+                'image_id':     np.array(self.image_ids, dtype=np.int32),
+                'category_id':  np.array(self.category_ids, dtype=np.int32),
+                'iscrowd':      np.array(self.iscrowd, dtype=np.uint8),
+                'area':         np.array(self.area, dtype=np.float32),
+                'bbox':         np.array(self.bbox, dtype=np.float32).reshape(-1, 4),
+                'vertices':     np.array(self.vertices, dtype=np.float32),
+                'poly_offsets': poly_offsets,
+                'anno_offsets': anno_offsets,
+                'extra_index':  np.array(self.extra_index, dtype=np.int32),
+                'extras':       self.extras,
+                'keys':         self.keys or list(ANNO_KEYS)}
+
+#---------------------------------------
+def _empty_columns():
+    ''' Columns store without annotations.'''
+    return _ColumnsBuilder().columns()
+
+#---------------------------------------
+def _anno2columns(annotations):
+    '''Transform annotations list into columnar store.
+
+    Parameters
+    ----------
+    annotations: list[dict],
+      annotations in COCO format.
+
+    Returns
+    ----------
+    dict[string:ndarray]: columns store, see _ColumnsBuilder.
+    '''
+    return _ColumnsBuilder().extend(annotations).columns()
+
+#---------------------------------------
+def _float32_exact(values):
+    ''' Transform float32 array into float64 array
+        with the shortest float32 representation
+        (1421.84 instead of 1421.8399658203125).
+
+    Notes
+    -------
+    vectorized: each value is rounded to k = 1..9 significant
+      digits in float64 at once (integer scaled by exact power 
+      of ten, so the result is the nearest float64 of the decimal),
+      the least k which gives back the same float32 is taken; 
+      the same as conversion through string (numpy shortest repr),
+      which is used for values out of exact powers of ten.
+    '''
+    x   = np.asarray(values, dtype=np.float32)
+    shape, x = x.shape, x.ravel()
+    out = np.empty(len(x), dtype=np.float64)
+    for start in range(0, len(x), EXACT_BLOCK): # BOUNDED TEMPORARY ARRAYS
+        out[start:start + EXACT_BLOCK] = _float32_shortest(x[start:start + EXACT_BLOCK])
+    return out.reshape(shape)
+
+def _float32_shortest(x):
+    ''' Shortest representation of flat float32 array, see _float32_exact.'''
+    out   = x.astype(np.float64)
+    a     = np.abs(out)
+    valid = (a > 0) & np.isfinite(a)
+    with np.errstate(divide='ignore', invalid='ignore', over='ignore'):
+        e  = np.floor(np.log10(np.where(valid, a, 1.)))
+        e += 10.**(e + 1) <= a # LOG10 ROUNDING NEAR POWERS OF TEN
+        e -= (10.**e > a) & valid
+        p  = (FLOAT32_DIGITS - 1) - e[:, None]
+        scale = 10.**np.abs(p)
+        y  = np.where(p >= 0, np.rint(a[:, None]*scale)/scale, 
+                              np.rint(a[:, None]/scale)*scale)
+    ok   = y.astype(np.float32) == np.abs(x)[:, None]
+    fast = valid & ok.any(axis=1) & (np.abs(e) <= 12)
+    k    = ok.argmax(axis=1)
+    out[fast] = np.copysign(y[fast, k[fast]], out[fast])
+    slow = valid & ~fast
+    if slow.any(): out[slow] = x[slow].astype(str).astype(np.float64)
+    return out
+
+def _float32_list(values):
+    ''' Transform float32 array into list of python floats,
+        see _float32_exact.
+    '''
+    return _float32_exact(values).tolist()
+
+def _json_copy(value):
+    ''' Copy of JSON value (nested dicts and lists),
+        faster than copy.deepcopy.'''
+    if isinstance(value, dict): return {k:_json_copy(v) for k,v in value.items()}
+    if isinstance(value, list): return [_json_copy(v) for v in value]
+    return value
+
+#---------------------------------------
+def _anno_polygons(columns, pos):
+    '''Polygons of annotation at position pos.
+
+    Returns
+    ----------
+    list[ndarray[float32]]: polygons (views of vertices buffer)
+      in format [x,y,x,y,...].
+    '''
+    po = columns['poly_offsets']
+    p0, p1 = columns['anno_offsets'][pos], columns['anno_offsets'][pos + 1]
+    return [columns['vertices'][po[p]:po[p + 1]] for p in range(p0, p1)]
+
+#---------------------------------------
+def _columns2anno(columns, positions = None):
+    '''Transform columns store into annotations in COCO format.
+
+    Parameters
+    ----------
+    columns: dict[string:ndarray],
+      columns store, see _ColumnsBuilder.
+    positions: list[int],
+      positions of annotations to output, all if None.
+
+    Returns
+    ----------
+    list[dict]: annotations in COCO format.
+    '''
+    if positions is None:
+        positions = np.arange(len(columns['id']))
+    positions = np.asarray(positions, dtype=np.int64)
+    if len(positions) == 0: return []
+    sub = _take_columns(columns, positions)
+
+    ids          = sub['id'].tolist()
+    image_ids    = sub['image_id'].tolist()
+    category_ids = sub['category_id'].tolist()
+    iscrowd      = sub['iscrowd'].tolist()
+    n            = len(ids)
+    floats       = np.concatenate([sub['area'], sub['bbox'].ravel(), sub['vertices']])
+    floats       = _float32_exact(floats)
+    area         = floats[:n].tolist()
+    bbox         = floats[n:5*n].reshape(-1, 4)
+    has_area     = ~np.isnan(sub['area'])
+    has_bbox     = ~np.isnan(sub['bbox']).any(axis=1)
+    vertices     = floats[5*n:].tolist()
+    po, ao       = sub['poly_offsets'].tolist(), sub['anno_offsets'].tolist()
+
+    annotations = []
+    for i in range(len(ids)):
+        extra = columns['extras'][sub['extra_index'][i]]
+        value = {'id': ids[i],
+                 'image_id': image_ids[i],
+                 'category_id': category_ids[i],
+                 'segmentation': [vertices[po[p]:po[p+1]] for p in range(ao[i], ao[i+1])],
+                 'iscrowd': iscrowd[i]}
+        if has_area[i]: value['area'] = area[i]
+        if has_bbox[i]: value['bbox'] = bbox[i].tolist()
+        value.update(_json_copy(extra))
+        ann = {k:value[k] for k in columns['keys'] if k in value}
+        ann.update({k:v for k,v in value.items() if k not in ann})
+        annotations.append(ann)
+    return annotations
+
+#---------------------------------------
+def _take_columns(columns, positions):
+    '''Select annotations from columns store by positions,
+       ragged polygon buffers are gathered without python loop.
+
+    Parameters
+    ----------
+    columns: dict[string:ndarray],
+      columns store, see _ColumnsBuilder.
+    positions: ndarray[int] or ndarray[bool],
+      positions or mask of annotations to select.
+
+    Returns
+    ----------
+    dict[string:ndarray]: new columns store.
+    '''
+    positions = np.arange(len(columns['id']))[positions] \
+                    if np.asarray(positions).dtype == bool \
+                    else np.asarray(positions, dtype=np.int64)
+
+    ao, po = columns['anno_offsets'], columns['poly_offsets']
+
+    # POLYGONS OF SELECTED ANNOTATIONS
+    npolys    = ao[positions + 1] - ao[positions]
+    poly_idx  = _ragged_arange(ao[positions], npolys)
+
+    # VERTICES OF SELECTED POLYGONS
+    nvert     = po[poly_idx + 1] - po[poly_idx]
+    vert_idx  = _ragged_arange(po[poly_idx], nvert)
+
+    anno_offsets = np.zeros(len(positions) + 1, dtype=np.int64)
+    np.cumsum(npolys, out=anno_offsets[1:])
+    poly_offsets = np.zeros(len(poly_idx) + 1, dtype=np.int64)
+    np.cumsum(nvert, out=poly_offsets[1:])
+
+    out = {k: columns[k][positions]
+              for k in ('id', 'image_id', 'category_id', 'iscrowd',
+                        'area', 'bbox', 'extra_index')}
+    out.update({'vertices':     columns['vertices'][vert_idx],
+                'poly_offsets': poly_offsets,
+                'anno_offsets': anno_offsets,
+                'extras':       columns['extras'],
+                'keys':         columns['keys']})
+    return out
+
+def _ragged_arange(starts, lengths):
+    ''' Concatenation of ranges [start, start + length) '''
+    starts  = np.asarray(starts, dtype=np.int64)
+    lengths = np.asarray(lengths, dtype=np.int64)
+    total   = int(lengths.sum())
+    if total == 0: return np.empty(0, dtype=np.int64)
+    ends = np.cumsum(lengths)
+    idx  = np.arange(total, dtype=np.int64)
+    return idx + np.repeat(starts - (ends - lengths), lengths)
+
+#---------------------------------------
+def _columns_nbytes(columns):
+    ''' Memory used by arrays of the columns store in bytes.'''
+    return int(sum(v.nbytes for v in columns.values() if isinstance(v, np.ndarray)))
+
+#---------------------------------------
+def _scale_columns(columns, scale_x, scale_y, shift_x = 0., shift_y = 0.):
+    '''Scale and shift geometry (bbox, area, polygons) of annotations,
+       all annotations are processed in one vectorized step.
+
+    Parameters
+    ----------
+    columns: dict[string:ndarray],
+      columns store, see _ColumnsBuilder.
+    scale_x, scale_y: ndarray[float] (N),
+      horizontal and vertical scale for each annotation.
+    shift_x, shift_y: ndarray[float] (N),
+      horizontal and vertical shift after scale.
+
+    Returns
+    ----------
+    dict[string:ndarray]: new columns store
+      (RLE segmentations in extras are not changed).
+    '''
+    sx = np.asarray(scale_x, dtype=np.float64)
+    sy = np.asarray(scale_y, dtype=np.float64)
+    bx = np.broadcast_to(np.asarray(shift_x, dtype=np.float64), sx.shape)
+    by = np.broadcast_to(np.asarray(shift_y, dtype=np.float64), sy.shape)
+    ao, po = columns['anno_offsets'], columns['poly_offsets']
+
+    # ANNOTATION AND COORDINATE AXIS OF EACH VERTEX
+    vert_anno = np.repeat(np.arange(len(sx)), po[ao[1:]] - po[ao[:-1]])
+    vert_axis = (np.arange(po[-1]) - np.repeat(po[:-1], np.diff(po))) % 2
+    scale     = np.where(vert_axis == 0, sx[vert_anno], sy[vert_anno])
+    shift     = np.where(vert_axis == 0, bx[vert_anno], by[vert_anno])
+
+    out = dict(columns)
+    out['vertices'] = (columns['vertices'] * scale + shift).astype(np.float32)
+    out['bbox']     = (columns['bbox'] * np.stack([sx, sy, sx, sy], axis=1) 
+                         + np.stack([bx, by, 0*bx, 0*by], axis=1)).astype(np.float32)
+    out['area']     = (columns['area'] * sx * sy).astype(np.float32)
+    return out
+
+#---------------------------------------
+def _clip_polygon(poly, width, height):
+    '''Clip polygon [x,y,x,y,...] by rectangle [0,width] x [0,height]
+       (Sutherland-Hodgman), returns flat array of vertices.'''
+    pts = np.asarray(poly, dtype=np.float64).reshape(-1, 2)
+    for axis, limit, upper in ((0, 0., False), (0, width, True), (1, 0., False), (1, height, True)):
+        if len(pts) == 0: break
+        inside = pts[:, axis] <= limit if upper else pts[:, axis] >= limit
+        out, prev, prev_in = [], pts[-1], inside[-1]
+        for cur, cur_in in zip(pts, inside):
+            if cur_in != prev_in: # EDGE CROSSES THE LIMIT
+                t = (limit - prev[axis]) / (cur[axis] - prev[axis])
+                out.append(prev + t*(cur - prev))
+            if cur_in: out.append(cur)
+            prev, prev_in = cur, cur_in
+        pts = np.asarray(out, dtype=np.float64).reshape(-1, 2)
+    return pts.ravel()
+
+def _polygon_area(poly):
+    ''' Area of polygon [x,y,x,y,...] (shoelace formula).'''
+    x, y = np.asarray(poly[0::2], dtype=np.float64), np.asarray(poly[1::2], dtype=np.float64)
+    return 0.5*abs(np.dot(x, np.roll(y, -1)) - np.dot(y, np.roll(x, -1)))
+
+def _clip_columns(columns, width, height):
+    '''Clip geometry (bbox, area, polygons) of annotations by frame
+       [0,width] x [0,height] of their images (e.g. after crop).
+
+    Parameters
+    ----------
+    columns: dict[string:ndarray],
+      columns store, see _ColumnsBuilder.
+    width, height: ndarray[float] (N),
+      frame size for each annotation.
+
+    Returns
+    ----------
+    dict[string:ndarray]: new columns store.
+    ndarray[bool] (N): False for annotations fully outside of frame.
+
+    Notes
+    ----------
+    only annotations with bbox out of frame are changed: polygons are
+      clipped, bbox is bounds of clipped polygons (clipped bbox if there
+      are no polygons), area is scaled by the ratio of polygons areas 
+      (of bbox areas if there are no polygons).
+    '''
+    w, h = np.asarray(width, dtype=np.float64), np.asarray(height, dtype=np.float64)
+    bbox = columns['bbox'].astype(np.float64)
+    x0, y0 = bbox[:, 0], bbox[:, 1]
+    x1, y1 = x0 + bbox[:, 2], y0 + bbox[:, 3]
+    outside = (x0 < 0) | (y0 < 0) | (x1 > w) | (y1 > h)
+    cx0, cx1 = np.clip(x0, 0, w), np.clip(x1, 0, w)
+    cy0, cy1 = np.clip(y0, 0, h), np.clip(y1, 0, h)
+    keep  = ~outside | ((cx1 > cx0) & (cy1 > cy0))
+    new_bbox = np.where(outside[:, None], np.stack([cx0, cy0, cx1 - cx0, cy1 - cy0], axis=1), bbox)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        ratio = np.where(outside, (cx1 - cx0)*(cy1 - cy0) / (bbox[:, 2]*bbox[:, 3]), 1.)
+    area = columns['area'].astype(np.float64) * np.nan_to_num(ratio, nan=1.)
+
+    ao, po   = columns['anno_offsets'], columns['poly_offsets']
+    vertices = columns['vertices']
+    npolys   = np.diff(ao)
+    plens    = np.diff(po)
+    affected = np.flatnonzero(outside & (npolys > 0))
+    pieces, lengths, start = [], [], 0
+    for i in affected:
+        pieces.append(vertices[po[ao[start]]:po[ao[i]]])
+        lengths.append(plens[ao[start]:ao[i]])
+        polys = [vertices[po[p]:po[p + 1]] for p in range(ao[i], ao[i + 1])]
+        full  = sum(_polygon_area(poly) for poly in polys)
+        polys = [_clip_polygon(poly, w[i], h[i]) for poly in polys]
+        polys = [poly for poly in polys if len(poly) >= 6 and _polygon_area(poly) > 0]
+        npolys[i] = len(polys)
+        if len(polys) == 0:
+            keep[i] = False
+        else:
+            flat = np.concatenate(polys)
+            bx0, by0 = flat[0::2].min(), flat[1::2].min()
+            new_bbox[i] = (bx0, by0, flat[0::2].max() - bx0, flat[1::2].max() - by0)
+            if full > 0: area[i] = columns['area'][i] * sum(_polygon_area(poly) for poly in polys) / full
+        pieces += polys
+        lengths.append(np.asarray([len(poly) for poly in polys], dtype=np.int64))
+        start = i + 1
+    pieces.append(vertices[po[ao[start]]:])
+    lengths.append(plens[ao[start]:])
+
+    out = dict(columns)
+    out['bbox'] = new_bbox.astype(np.float32)
+    out['area'] = area.astype(np.float32)
+    if len(affected) > 0:
+        lengths = np.concatenate(lengths)
+        out['vertices']     = np.concatenate(pieces).astype(np.float32)
+        out['poly_offsets'] = np.concatenate([[0], np.cumsum(lengths)]).astype(np.int64)
+        out['anno_offsets'] = np.concatenate([[0], np.cumsum(npolys)]).astype(np.int64)
+    return out, keep
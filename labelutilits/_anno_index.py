@@ -0,0 +1,118 @@
+import numpy as np
+
+__all__ = ['_group_positions', '_build_index', '_index_positions', '_image_position',
+           '_image_positions']
+
+#---------------------------------------
+def _group_positions(keys):
+    '''Group positions of array elements by their values.
+
+    Parameters
+    ----------
+    keys: ndarray[int],
+      1d array of keys (ids) for each position.
+
+    Returns
+    ----------
+    dict[int:ndarray[int]],
+      positions for each unique key in ascending order.
+    '''
+    keys  = np.asarray(keys, dtype=np.int64)
+    order = np.argsort(keys, kind='stable')
+    uniq, starts = np.unique(keys[order], return_index=True)
+    return dict(zip(uniq.tolist(), np.split(order, starts[1:])))
+
+#---------------------------------------
+def _build_index(image_ids, category_ids, images):
+    '''Build index of annotations positions.
+
+    Parameters
+    ----------
+    image_ids: ndarray[int],
+      image_id of each annotation.
+    category_ids: ndarray[int],
+      category_id of each annotation.
+    images: list[dict],
+      images descriptors in COCO format.
+
+    Returns
+    ----------
+    dict: index with keys:
+      * 'images': dict[int:int], position of image descriptor by image id;
+      * 'image': dict[int:ndarray], annotation positions by image id;
+      * 'cat': dict[int:ndarray], annotation positions by category id;
+      * 'image_cat': dict[(int,int):ndarray], annotation positions
+         by pair (image id, category id);
+      * 'length': int, number of annotations.
+    '''
+    image_ids    = np.asarray(image_ids, dtype=np.int64)
+    category_ids = np.asarray(category_ids, dtype=np.int64)
+
+    pair_keys = (image_ids << 32) | category_ids
+    image_cat = {(key >> 32, key & 0xffffffff): pos
+                   for key, pos in _group_positions(pair_keys).items()}
+
+    return {'images':    {x['id']:i for i, x in enumerate(images)},
+            'image':     _group_positions(image_ids),
+            'cat':       _group_positions(category_ids),
+            'image_cat': image_cat,
+            'length':    len(image_ids)}
+
+#---------------------------------------
+def _image_position(index, image_id):
+    '''Position of image descriptor in data['images'],
+       None if image id does not exist.
+    '''
+    return index['images'].get(int(image_id))
+
+def _image_positions(index, image_ids):
+    '''Positions of image descriptors for array of image ids,
+       -1 for image ids which do not exist.
+    '''
+    image_ids = np.asarray(image_ids, dtype=np.int64)
+    if len(index['images']) == 0:
+        return np.full(len(image_ids), -1, dtype=np.int64)
+    ids  = np.fromiter(index['images'].keys(),   dtype=np.int64, count=len(index['images']))
+    pos  = np.fromiter(index['images'].values(), dtype=np.int64, count=len(index['images']))
+    order = np.argsort(ids)
+    ids, pos = ids[order], pos[order]
+    loc = np.clip(np.searchsorted(ids, image_ids), 0, len(ids) - 1)
+    return np.where(ids[loc] == image_ids, pos[loc], -1)
+
+#---------------------------------------
+def _index_positions(index, image_ids = None, cat_ids = None):
+    '''Select annotation positions by image ids and category ids.
+
+    Parameters
+    ----------
+    index: dict,
+      index of annotations, see _build_index.
+    image_ids: int; list[int],
+      images to select, all if None.
+    cat_ids: int; list[int],
+      categories to select, all if None.
+
+    Returns
+    ----------
+    ndarray[int]: annotation positions, grouped in order
+      of image_ids and ascending inside each image.
+    '''
+    empty = np.empty(0, dtype=np.int64)
+
+    if cat_ids is not None:
+        cat_ids = np.atleast_1d(cat_ids).astype(int).tolist()
+
+    if image_ids is None:
+        if cat_ids is None:
+            return np.arange(index['length'], dtype=np.int64)
+        pos = [index['cat'].get(c, empty) for c in cat_ids]
+        return np.unique(np.concatenate([empty, *pos]))
+
+    out = []
+    for image_id in np.atleast_1d(image_ids).astype(int).tolist():
+        if cat_ids is None:
+            out.append(index['image'].get(image_id, empty))
+        else:
+            pos = [index['image_cat'].get((image_id, c), empty) for c in cat_ids]
+            out.append(np.unique(np.concatenate([empty, *pos])))
+    return np.concatenate([empty, *out])
@@ -0,0 +1,129 @@
+import os
+import hashlib
+import zipfile
+import numpy as np
+
+from ._jsonio import _loads, _dumps
+
+__all__ = ['_snapshot_path', '_source_key', '_save_snapshot',
+           '_read_snapshot', '_load_snapshot']
+
+SNAPSHOT_FORMAT  = 'labelutilits-snapshot'
+SNAPSHOT_VERSION = 1
+SNAPSHOT_SUFFIX  = '.npz'
+HASH_CHUNK       = 2**20
+
+# ARRAYS OF COLUMNS STORE, OTHER FIELDS ARE KEPT IN HEADER
+ARRAY_KEYS = ('id', 'image_id', 'category_id', 'iscrowd', 'area', 'bbox',
+              'vertices', 'poly_offsets', 'anno_offsets', 'extra_index')
+
+#-----------------------------------
+def _snapshot_path(anno_path):
+    ''' Path of snapshot written next to annotation file.'''
+    return anno_path + SNAPSHOT_SUFFIX
+
+def _file_hash(path):
+    ''' Digest (blake2b) of file content.'''
+    digest = hashlib.blake2b(digest_size = 16)
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def _source_key(anno_path, with_hash = True):
+    ''' Key of annotation file: 'mtime_ns', 'size' and 'hash' of content.'''
+    stat = os.stat(anno_path)
+    return {'mtime_ns': stat.st_mtime_ns, 'size': stat.st_size,
+            'hash': _file_hash(anno_path) if with_hash else None}
+
+#-----------------------------------
+def _save_snapshot(snapshot_path, data, columns, source = None):
+    '''
+    Write data and columns store into binary snapshot (uncompressed .npz),
+      through temporary file and atomic rename.
+
+    Paramters
+    ----------
+    snapshot_path: string,
+      path to snapshot file.
+    data: dict,
+      COCO fields except 'annotations'.
+    columns: dict[string:ndarray],
+      columns store, see _anno_columns._ColumnsBuilder.
+    source: dict,
+      key of annotation file (see _source_key) the snapshot
+      is parsed from, snapshot is not bound to file if None.
+
+    Notes
+    ------
+    arrays of columns store are written as they are, data,
+      extras and keys are written as JSON header.
+    '''
+    header = {'format': SNAPSHOT_FORMAT, 'version': SNAPSHOT_VERSION,
+              'source': source, 'data': data,
+              'extras': columns['extras'], 'keys': columns['keys']}
+    header = np.frombuffer(_dumps(header).encode(), dtype = np.uint8)
+    tmp_pth = snapshot_path + '.part'
+    try:
+        with open(tmp_pth, 'wb') as f:
+            np.savez(f, header = header, **{k:np.asarray(columns[k]) for k in ARRAY_KEYS})
+        os.replace(tmp_pth, snapshot_path)
+    finally:
+        if os.path.exists(tmp_pth): os.remove(tmp_pth)
+    return snapshot_path
+
+#-----------------------------------
+def _read_snapshot(snapshot_path):
+    '''
+    Read binary snapshot written by _save_snapshot.
+
+    Returns
+    ------------
+    dict: COCO fields except 'annotations'.
+    dict[string:ndarray]: columns store.
+    dict: key of source annotation file, None if not bound.
+    '''
+    try:
+        with np.load(snapshot_path, allow_pickle = False) as npz:
+            header  = _loads(npz['header'].tobytes())
+            if header.get('format') != SNAPSHOT_FORMAT or \
+               header.get('version') != SNAPSHOT_VERSION:
+                raise ValueError('unsupported format or version')
+            columns = {k:npz[k] for k in ARRAY_KEYS}
+    except (KeyError, ValueError, zipfile.BadZipFile, EOFError) as e:
+        raise ValueError(f'{snapshot_path} is not annotation snapshot: {e}')
+    columns.update({'extras': header['extras'], 'keys': header['keys']})
+    return header['data'], columns, header['source']
+
+def _load_snapshot(snapshot_path, anno_path):
+    '''
+    Read snapshot if it is valid for annotation file: modification time
+      and size are the same or size and hash of content are the same.
+
+    Returns
+    ------------
+    tuple(dict, dict[string:ndarray]): data and columns store,
+      None if snapshot is missed, broken or out of date.
+
+    Notes
+    ------
+    if only modification time is changed (the same hash), snapshot
+      is written again with new time, so the next load does not 
+      hash the file.
+    '''
+    if not os.path.isfile(snapshot_path): return None
+    try:
+        data, columns, source = _read_snapshot(snapshot_path)
+    except (OSError, ValueError):
+        return None # BROKEN SNAPSHOT IS REPLACED
+    if source is None: return None
+    key = _source_key(anno_path, with_hash = False)
+    if key['size'] != source['size']: return None
+    if key['mtime_ns'] != source['mtime_ns']:
+        key['hash'] = _file_hash(anno_path)
+        if key['hash'] != source['hash']: return None
+        try:
+            _save_snapshot(snapshot_path, data, columns, key)
+        except OSError:
+            pass # READ-ONLY LOCATION, FILE IS HASHED ON EACH LOAD
+    return data, columns
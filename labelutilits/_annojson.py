@@ -15,6 +15,7 @@ from PIL import Image
 from pycocotools.coco import COCO
 
 from ._path import *
+from ._jsonio import _load, _dump
 
 IMAGE_EXTENTIONS = ('.png', '.jpg', '.jpeg', '.tiff', '.bmp', '.gif')
 IMAGE_AND_LABELS_EXTANTIONS = (*IMAGE_EXTENTIONS,'txt','csv','xml','json','txt')
@@ -25,8 +26,7 @@ def print_anno_info(anno_path):
     ''' 
     Print some information about json file 
     of annotations in COCO format'''
-    with open(anno_path) as json_file:
-        data = json.load(json_file)
+    anno_data = _load(anno_path)
     print('DATASET KEYS:' ,anno_data.keys())
     print('DATASET ANN KEYS:', anno_data['annotations'][0].keys())
     print('CATEGORIES: ',anno_data['categories'])
@@ -80,7 +80,10 @@ def anno_info(anno_path, image_dir_path = None):
         image_dir_path = os.path.split(anno_path)[0]
     dataset_info_dict['image_dir_path']  = image_dir_path
 
-    coco=COCO(anno_path)
+    anno_data = _load(anno_path) # PARSED ONCE, SHARED WITH COCO OBJECT
+    coco = COCO()
+    coco.dataset = anno_data
+    coco.createIndex()
     dataset_info_dict['length']      = len(coco.imgs)
     dataset_info_dict['anno_number'] = len(coco.anns)    
 
@@ -95,8 +98,6 @@ def anno_info(anno_path, image_dir_path = None):
     dataset_info_dict['width']  = list(set(df['width']))    
     dataset_info_dict['COCO_obj']  = coco
     
-    with open(anno_path) as json_file:
-        anno_data = json.load(json_file)
     '''         
     dataset_info_dict['dataset_keys']  = (anno_data.keys())   
     if anno_data['annotations'] !=[]:
@@ -160,9 +161,7 @@ def correct_anno_img_names(anno_path, image_dir_path=None, image_id = None):
 #     coco_anno_dict,  coco, image_dir_path = anno2coco(anno_path, image_dir_path)
     df = pd.DataFrame(columns = ['old_path', 'new_path'])
     
-    with open(anno_path) as json_file:
-        data = json.load(json_file)
-        json_file.close()
+    data = _load(anno_path)
 
      
     for i in range(len(data['images'])):  
@@ -179,8 +178,7 @@ def correct_anno_img_names(anno_path, image_dir_path=None, image_id = None):
         
         df = pd.concat([df, pd.DataFrame(dict_)])
 
-    with open(anno_path, 'w') as f:
-        json.dump(data, f)
+    _dump(data, anno_path)
     
     return df
 
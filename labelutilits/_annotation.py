@@ -1,34 +1,100 @@
 import os
+import copy
 import numpy as np
 import json
 from PIL import Image
 import pandas as pd
 from pprint import pprint
+from collections import deque
  
 
 from ._annotation_base import (_set_cat_names,
                                _cat_ids,
                                _filter_cat,
+                               _filter_cat_columns,
                                _replace_image_dir,
                                _get_data_info,
                                _most_frequent_size, 
                                _image_list,
-                               _count_anno_at_images,
+                               _image_fname,
                               )
 
 from ._reset_annotation import (_reset_indexes,
                                 _reset_images,
                                 _reset_labels,
                                 _reset_image_sizes, 
+                                _reset_columns,
                                 reset_annotation)
 
 from ._image_base import (_resize_imgs,
-                          _imgs2gray)
+                          _imgs2gray,
+                          _read_image,
+                          _read_image_region,
+                          _region_box)
+
+from ._image_cache import ImageCache
+
+from ._image_transform import (_transform_images,
+                               _manifest_path,
+                               _op_steps,
+                               _plan_steps,
+                               _steps2mask)
+
+from ._image_pipeline import ImagePipeline
+
+
+from ._coco_stream import (_load_columns,
+                           write_coco)
+
+from ._anno_snapshot import (_snapshot_path,
+                             _source_key,
+                             _save_snapshot,
+                             _read_snapshot,
+                             _load_snapshot)
 
 from ._coco_base import (_ann2mask,
+                         _segm2mask,
+                         _rle2crop,
+                         _crop2region,
+                         paste_mask,
+                         sparse2dense,
+                         _sparse2mode,
                          _masks2image,
+                         label_map2image,
                          _masks2d,
-                         _image_with_bbox)
+                         _image_with_bbox,
+                         _transform_rle)
+
+from ._mask_batch import (_iter_masks,
+                          _iter_chunks,
+                          _cached_masks_task)
+
+from ._vertex_store import (_map_vertex_store,
+                            _is_mapped,
+                            _polygon_ref)
+
+from ._mask_cache import (MaskCache,
+                          _segm_hash)
+
+from ._rle import (segm2rle,
+                   rle_area,
+                   rle_bbox,
+                   rle_union,
+                   rle_intersection,
+                   rle_coverage,
+                   rle_iou)
+
+from ._anno_index import (_build_index,
+                          _index_positions,
+                          _image_position,
+                          _image_positions)
+
+from ._anno_columns import (_columns2anno,
+                            _anno_polygons,
+                            _float32_exact,
+                            _take_columns,
+                            _scale_columns,
+                            _clip_columns)
 
 
     
@@ -42,6 +108,16 @@ class Annotation():
       path for annotation file
     image_dir_path: string,
       path for image directory
+    data: dict[list[dict]],
+      COCO JSON fields except 'annotations'.
+    columns: dict[string:ndarray],
+      annotations in columnar (struct-of-arrays) store,
+      see _anno_columns._ColumnsBuilder.
+    image_mmap: bool,
+      if True, get_image returns uncompressed BMP as view 
+      of memory-mapped file; if False, images are read into memory
+      (on Windows mapped file can not be replaced while view exists,
+      so set False before transforms of images in place).
 
     '''
  
@@ -57,28 +133,56 @@ class Annotation():
     save: Save data in json format
     data_dict:Return data in format dict[list[dict]]
     rest_ids: Reset category ids; image ids; anno_ids
+    resize: Resize images and rescale annotations
+    export_snapshot: Save data into binary snapshot
+    import_snapshot: Load data from binary snapshot
     ''' 
-    def __init__(self, anno_path, image_dir_path = None):
+    def __init__(self, anno_path, image_dir_path = None, snapshot = True):
         self.anno_path = anno_path
         self.image_dir_path = image_dir_path
         if self.image_dir_path == None:
             self.image_dir_path = os.path.split(anno_path)[0]
-        self.open_data(self.anno_path)
-        self.counts_anno = _count_anno_at_images(self.data)
+        self.open_data(self.anno_path, snapshot)
         self.report = dict()
+        self.mask_cache   = None
+        self.image_cache  = None
+        self.vertex_store = None
+        self.image_mmap   = True
     
     #---------------------------------
-    def open_data(self, anno_path):
+    def open_data(self, anno_path, snapshot = True):
         ''' Open data in json format.
         
         Paramters
         ----------
         anno_path: string,
           annotation path for json coco comatible format file. 
+        snapshot: bool,
+          if True, binary snapshot next to annotation file
+          (anno_path + '.npz') is loaded instead of parsing
+          if it is valid, otherwise it is written after parsing.
+
+        Notes
+        ------
+        file is read incrementally, annotations are put
+          directly into columns store. Snapshot is valid if 
+          modification time and size of annotation file 
+          are the same, or size and hash of content.
         '''
         self.anno_path = anno_path
-        with open(self.anno_path) as json_file:
-            self.data = json.load(json_file)
+        snapshot_path  = _snapshot_path(anno_path)
+        loaded = _load_snapshot(snapshot_path, anno_path) if snapshot else None
+        if loaded is None:
+            source = _source_key(anno_path) if snapshot else None # BEFORE PARSING
+            self.data, self.columns = _load_columns(self.anno_path)
+            if snapshot:
+                try:
+                    _save_snapshot(snapshot_path, self.data, self.columns, source)
+                except OSError:
+                    pass # READ-ONLY DIRECTORY, SNAPSHOT IS SKIPPED
+        else:
+            self.data, self.columns = loaded
+        self.__build_index()
         return self
 
     #---------------------------------
@@ -96,7 +200,7 @@ class Annotation():
         return self
     
     #---------------------------------
-    def filter_cat(self, cat_ids = None):
+    def filter_cat(self, cat_ids = None, empty_images = 'drop'):
         '''Rest only selected category 
            if None filter only images contains some labeling.
         
@@ -104,8 +208,15 @@ class Annotation():
         ----------
         cat_ids: string,
           category (class) indexes to rest.   
+        empty_images: string,
+          policy for images without annotations after filter:
+          'drop' - remove them; 'keep' - keep all images;
+          'drop_filtered' - remove only images which lost
+          all annotations by filter.
         '''
-        self.data = _filter_cat(self.data, cat_ids = cat_ids)
+        self.data, self.columns = _filter_cat_columns(self.data, self.columns, self.index,
+                                                      cat_ids, empty_images)
+        self.__build_index()
         return self
     
     #---------------------------------
@@ -123,22 +234,43 @@ class Annotation():
         return self
     
     #---------------------------------
-    def reset_annotation(self):
+    def reset_annotation(self, n_threads = 16, probe_cache = None):
         '''
         Reset annotation in COCO JSON annotations,
           relative to existed in image directory,
           also id of images and annotation will be renewd.
-        
+
+        Paramters
+        ----------
+        n_threads: int,
+          number of threads to probe image sizes.
+        probe_cache: string,
+          path to json file with image sizes from previous runs, 
+          only images modified since are probed; not used if None.
         '''        
-        self.data, report = reset_annotation(self.data)
+        self.data, self.columns, report = _reset_columns(self.data, self.columns, 
+                                                         n_threads, probe_cache)
+        self.__build_index()
         self.report.update({'deleted_as_unexisted':report})
         return self
     
+    #---------------------------------    
+    def copy(self):
+        ''' Return independent copy of annotation
+            (mask and image caches are shared).'''
+        new = copy.copy(self)
+        new.data    = copy.deepcopy(self.data)
+        new.columns = {k:(v.copy() if isinstance(v, np.ndarray) else copy.deepcopy(v))
+                         for k,v in self.columns.items()}
+        new.report  = dict()
+        new.__build_index()
+        return new
+
     #---------------------------------    
     def data_dict(self):
         ''' Return data in COCO JSON 
             compatible format dict[list[dict]]'''
-        return self.data
+        return {**self.data, 'annotations': _columns2anno(self.columns)}
     
     #--------------------------------------
     def info(self):
@@ -166,6 +298,7 @@ class Annotation():
         * image_fname_example: image file name example.
         '''
         info =  _get_data_info(self.data)        
+        info['anno_number'] = len(self.columns['id'])
         info = {**info, 
                 'anno_path':self.anno_path,
                 'anno_fname':os.path.split(self.anno_path)[1]}
@@ -177,7 +310,7 @@ class Annotation():
         pprint(self.info())
         return self
     #--------------------------------------
-    def save_anno(self, new_path = None, replace_path = False):
+    def save_anno(self, new_path = None, replace_path = False, precision = None):
         ''' Save annotation in json format,
             if path is none anno_path is utilized.
         
@@ -188,6 +321,13 @@ class Annotation():
           if None, old path is utilized.
         replace_path: bool,
           if True, new_path replace anno_path.
+        precision: int,
+          number of decimals for floats, not rounded if None.
+
+        Notes
+        ------
+        annotations are written from columns store by chunks 
+          (compact separators), through temporary file and atomic rename.
         '''
         if new_path == None: new_path = self.anno_path
         
@@ -196,22 +336,139 @@ class Annotation():
                             os.path.split(self.anno_path)[0],
                             new_path)
        
-        with open(new_path, 'w') as f:
-            json.dump(self.data, f)
+        write_coco(new_path, self.data, self.columns, precision)
 
         if replace_path:
             self.anno_path = new_path
             
         return self
     
+    #--------------------------------------
+    def export_snapshot(self, snapshot_path):
+        ''' Save data and columns store into binary snapshot
+            (uncompressed npz), see import_snapshot.
+        
+        Parameters
+        ----------
+        snapshot_path: string,
+          path to snapshot file.
+
+        Returns
+        ----------
+        string: snapshot_path.
+
+        Notes
+        ------
+        exported snapshot is not bound to annotation file,
+          it is loaded only by import_snapshot.
+        '''
+        return _save_snapshot(snapshot_path, self.data, self.columns)
+
+    def import_snapshot(self, snapshot_path):
+        ''' Load data and columns store from binary snapshot
+            written by export_snapshot (or by open_data).
+        
+        Parameters
+        ----------
+        snapshot_path: string,
+          path to snapshot file.
+        '''
+        self.data, self.columns, _ = _read_snapshot(snapshot_path)
+        self.__build_index()
+        return self
+
     #--------------------------------------
     def get_anno_path(self) :
         ''' Return anno_path.'''
         return self.anno_path
     
+    #--------------------------------------
+    # CACHE
+    def set_mask_cache(self, path = None, max_bytes = 256*2**20):
+        '''
+        Set persistent cache of instances masks (compressed RLE),
+          masks found in the cache are not rasterized again.
+
+        Parameters
+        ----------
+        path: string,
+          path to cache file (sqlite) or directory,
+          if None, cache is disabled.
+        max_bytes: int,
+          maximal size of cache, least recently 
+          used masks are evicted if exceeded.
+
+        Notes
+        --------
+        entries are keyed by image id, annotation id and hash 
+          of polygons and image size, so changed annotations
+          are rasterized again. Cache hits and misses are
+          available in report['mask_cache'].
+        '''
+        if self.mask_cache is not None: self.mask_cache.close()
+        self.mask_cache = None if path is None else MaskCache(path, max_bytes)
+        if self.mask_cache is not None:
+            self.report['mask_cache'] = self.mask_cache.stats()
+        return self
+
+    #--------------------------------------
+    def set_image_cache(self, max_bytes = 512*2**20, readonly = True):
+        '''
+        Set in-memory LRU cache of decoded images for get_image.
+
+        Parameters
+        ----------
+        max_bytes: int,
+          maximal size of cached images in bytes,
+          if None, cache is disabled.
+        readonly: bool,
+          if True, cached images are returned as read-only arrays.
+
+        Notes
+        --------
+        entries are validated by file modification time and size.
+          Cache hits and misses are available in report['image_cache'].
+        '''
+        self.image_cache = None if max_bytes is None else ImageCache(max_bytes, readonly)
+        if self.image_cache is not None:
+            self.report['image_cache'] = self.image_cache.stats()
+        return self
+
+    #--------------------------------------
+    def set_vertex_store(self, path = None):
+        '''
+        Set memory-mapped store of polygons: flat vertex buffer
+          and offsets of columns store are moved into files 
+          (.npy) and mapped read-only.
+
+        Parameters
+        ----------
+        path: string,
+          directory of store files (e.g. anno_path + '.vertices'),
+          if None, polygons are moved back into memory.
+
+        Notes
+        --------
+        files are named by digest of content and never replaced, 
+          so stores of several annotations (e.g. filtered copy) 
+          may share directory and processes opening the same 
+          dataset share pages through OS cache; get_segmentations and get_masks slice only 
+          required polygons, iter_masks workers map the store 
+          themselves instead of receiving polygons.
+          Changes of geometry (filter_cat, resize, ...) produce 
+          polygons in memory, call set_vertex_store again to map them.
+        '''
+        if path is None:
+            self.columns = {k:(np.array(v) if isinstance(v, np.memmap) else v)
+                              for k,v in self.columns.items()}
+        else:
+            self.columns = _map_vertex_store(path, self.columns)
+        self.vertex_store = path
+        return self
+
     #--------------------------------------
     # IMAGE_DIRECTORY  
-    def resize_images(self,size = (224,224)):
+    def resize_images(self,size = (224,224), n_jobs = None, journal = None, output_dir = None):
         '''Resize Image by list of pathes
         Parameters
         -----------
@@ -219,31 +476,180 @@ class Annotation():
           image width and height. 
           If None, width, height are taken 
           as most frequent from data
+        n_jobs: int,
+          number of processes, os.cpu_count() if None,
+          in the current process if 1.
+        journal: string,
+          path to completion journal, if given, interrupted
+          run is resumed without processing completed images.
+        output_dir: string,
+          if given, originals are kept and resized images 
+          are written into output_dir, see resize.
 
         Returns
         --------
         list[string],
-          list of corrected images (report).
+          list of corrected images (report);
+        Annotation,
+          new annotation for images in output_dir
+          (with rescaled geometry) if output_dir is given.
+
+        Notes
+        ------
+        images are replaced atomically (via temporary file),
+          time of stages is available in report['resize_images'].
+          On Windows views returned by get_image with image_mmap 
+          must be released before images are replaced in place.
         '''
+        if output_dir is not None:
+            return self.copy().resize(size, output_dir, n_jobs, journal)
         if size is None or len(size)<2:
             width, height = _most_frequent_size(self.data)
         else:
             width, height = size[:2]
         img_pths = _image_list(self.data)
-        return _resize_imgs(img_pths, int(width), int(height))    
+        report_list, self.report['resize_images'] = _resize_imgs(img_pths, int(width), int(height),
+                                                                 n_jobs, journal)
+        return report_list
     
     #---------------------------------
-    def images2gray(self):
+    def images2gray(self, n_jobs = None, journal = None, output_dir = None):
         '''Convert Image to gray scale.
+        Parameters
+        -----------
+        n_jobs: int,
+          number of processes, os.cpu_count() if None,
+          in the current process if 1.
+        journal: string,
+          path to completion journal, if given, interrupted
+          run is resumed without processing completed images.
+        output_dir: string,
+          if given, originals are kept and gray images
+          are written into output_dir (images which are up to date
+          by manifest in output_dir are skipped).
 
         Returns
         --------
         list[string],
-          list of corrected images (report).
+          list of corrected images (report);
+        Annotation,
+          new annotation for images in output_dir 
+          if output_dir is given.
+
+        Notes
+        ------
+        images are replaced atomically (via temporary file),
+          time of stages is available in report['images2gray'].
+          On Windows views returned by get_image with image_mmap 
+          must be released before images are replaced in place.
         '''        
+        if output_dir is not None:
+            new = self.copy()
+            img_pths, dst_pths = new.__output_pathes(output_dir)
+            report_list, timing, _, _ = _transform_images(img_pths, 'gray', {}, n_jobs, 
+                                                       journal or _manifest_path(output_dir),
+                                                       dst_pths)
+            new.__set_output_pathes(output_dir, dst_pths)
+            new.report['images2gray'] = {'converted': report_list, **timing}
+            return new
         img_pths = _image_list(self.data)
-        return _imgs2gray(img_pths)
-    
+        report_list, self.report['images2gray'] = _imgs2gray(img_pths, n_jobs, journal)
+        return report_list
+
+    #---------------------------------
+    def resize(self, size = (224,224), output_dir = None, n_jobs = None, journal = None):
+        '''Resize images and rescale annotations (image width, height,
+           bbox, area and polygons) in one pass; geometry is rescaled from
+           the frame of image descriptors (width, height), so repeated
+           or resumed runs do not rescale it twice.
+        Parameters
+        -----------
+        size: tuple(int, int): width, height,
+          image width and height. 
+          If None, width, height are taken 
+          as most frequent from data
+        output_dir: string,
+          directory for resized images, file_name and image_dir_path
+          are replaced by it; images are resized in place if None.
+          Images which are up to date (by source modification time
+          and size in manifest of output_dir) are skipped.
+        n_jobs: int,
+          number of processes, os.cpu_count() if None,
+          in the current process if 1.
+        journal: string,
+          path to completion journal, if given, interrupted
+          run is resumed without processing completed images;
+          manifest of output_dir is used if None.
+
+        Notes
+        ------
+        list of changed images, time of stages and images whose
+          output size differs from planned by descriptor ('size_mismatch')
+          are available in report['resize'].
+        '''
+        if size is None or len(size)<2:
+            width, height = _most_frequent_size(self.data)
+        else:
+            width, height = size[:2]
+        width, height = int(width), int(height)
+
+        self.report['resize'] = self.__transform('resize', {'width': width, 'height': height},
+                                                 output_dir, n_jobs, journal)
+        return self
+
+    #---------------------------------
+    def transform_images(self, pipeline, n_jobs = None, journal = None, 
+                         output_dir = None, dry_run = False):
+        '''Apply chain of image operations (see ImagePipeline), 
+           each image is decoded and encoded once. Annotations 
+           (image width, height, bbox, area and polygons) are
+           transformed by resize, crop and pad steps.
+        Parameters
+        -----------
+        pipeline: ImagePipeline,
+          image operations.
+        n_jobs: int,
+          number of processes, os.cpu_count() if None,
+          in the current process if 1.
+        journal: string,
+          path to completion journal, if given, interrupted
+          run is resumed without processing completed images;
+          manifest of output_dir is used if None.
+        output_dir: string,
+          if given, originals are kept and images are written 
+          into output_dir (images which are up to date 
+          by manifest in output_dir are skipped).
+        dry_run: bool,
+          if True, only image headers are read and nothing is changed.
+
+        Returns
+        --------
+        list[string],
+          images which would be changed if dry_run;
+        Annotation,
+          self (images transformed in place) or new annotation
+          for images in output_dir if output_dir is given.
+
+        Notes
+        ------
+        list of changed images, time of stages and 'size_mismatch'
+          (see resize) are available in report['transform_images'];
+        after crop polygons, bbox and area are clipped by new image size,
+          ids of instances fully outside are in report['transform_images']['dropped'].
+        '''
+        params = {'steps': pipeline.steps}
+        if dry_run:
+            img_pths, dst_pths = self.__output_pathes(output_dir)
+            report_list, timing, _, _ = _transform_images(img_pths, 'pipeline', params, n_jobs,
+                                                       journal or (output_dir and _manifest_path(output_dir)),
+                                                       dst_pths, dry_run = True)
+            self.report['transform_images'] = {'changed': report_list, **timing}
+            return report_list
+        new = self if output_dir is None else self.copy()
+        new.report['transform_images'] = new.__transform('pipeline', params, 
+                                                         output_dir, n_jobs, journal)
+        return new
+
     # IMAGE_ID
     #-------------------------------------    
     def get_image_path(self, image_id):
@@ -259,11 +665,10 @@ class Annotation():
         ----------
         string: image pathes.
         '''
-        self.__check_image_id(image_id)
-        return os.path.join(self.image_dir_path ,self.data['images'][image_id - 1]['file_name'])
+        return os.path.join(self.image_dir_path ,self.get_image_descriptor(image_id)['file_name'])
     
     #-------------------------------------    
-    def get_image(self, image_id):
+    def get_image(self, image_id, region = None):
         '''
         Get image pathes by image id.
 
@@ -271,13 +676,35 @@ class Annotation():
         ----------
         image_id: int,
           images to select, start from 1.
+        region: tuple(int,int,int,int),
+          window (x0,y0,w,h) to read, whole image if None;
+          it is clipped by image bounds. Only the window is 
+          read where format allows it (see _read_image_region).
 
         Returns
         ----------
         ndarray: image.
+
+        Notes
+        --------
+        if image cache is set (see set_image_cache),
+          the cached array is returned, it is read-only by default,
+          cached images are always read into memory (never mapped).
+        if image_mmap is True, uncompressed BMP is returned as 
+          copy-on-write view of memory-mapped file, only touched 
+          pages are read; the view keeps file mapped (on Windows 
+          the file can not be replaced by in place transforms 
+          until view is released).
         '''
         image_path = self.get_image_path(image_id)
-        image      = np.array(Image.open(image_path))
+        if self.image_cache is None:
+            if region is None: return _read_image(image_path, self.image_mmap)
+            return _read_image_region(image_path, region, self.image_mmap)
+        image = self.image_cache.get(image_path, lambda pth: _read_image(pth, mmap = False))
+        self.report['image_cache'] = self.image_cache.stats()
+        if region is not None:
+            x0, y0, x1, y1 = _region_box(region, image.shape[1], image.shape[0])
+            image = image[y0:y1, x0:x1]
         return image
 
     #-------------------------------------    
@@ -296,15 +723,10 @@ class Annotation():
         Returns
         ----------
         list[dict]: annotations for image in COCO format.
-        
         '''
         self.__check_image_id(image_id)
-        anns = [x for x in self.data['annotations'] if x['image_id'] == image_id]
-        if cat_ids !=None:
-            cat_ids = np.atleast_1d(cat_ids).astype(int)
-            anns = [x for x in anns if x['category_id'] in cat_ids]
-        
-        return anns
+        positions = _index_positions(self.index, image_id, cat_ids)
+        return _columns2anno(self.columns, positions)
     #-------------------------------------        
     def get_image_descriptor(self, image_id):
         '''
@@ -320,7 +742,7 @@ class Annotation():
         dict: description for image in COCO format.
         '''        
         self.__check_image_id(image_id)
-        return self.data['images'][image_id-1]
+        return self.data['images'][_image_position(self.index, image_id)]
     
     #-----------------------------------------------
     def get_segmentations(self, image_id, cat_ids = None):
@@ -338,11 +760,14 @@ class Annotation():
         ----------
         list[list]: annotation for instances segmentation 
           for image in format [x,y,x,y...].
-        
         '''
-        anns = self.get_annotations(image_id = image_id, 
-                                    cat_ids = cat_ids)
-        return sum([x['segmentation'] for x in anns],[])
+        self.__check_image_id(image_id)
+        positions = _index_positions(self.index, image_id, cat_ids)
+        polys = [poly for i in positions for poly in _anno_polygons(self.columns, i)]
+        if len(polys) == 0: return []
+        bounds   = np.cumsum([0] + [len(poly) for poly in polys]).tolist()
+        vertices = _float32_exact(np.concatenate(polys)).tolist()
+        return [vertices[b0:b1] for b0, b1 in zip(bounds[:-1], bounds[1:])]
     
     #-----------------------------------------------
     def get_bboxes(self, image_id, cat_ids = None):
@@ -363,13 +788,14 @@ class Annotation():
         ----------
         list[list]: annotation for bounding boxes 
           for image in format [x0,y0,w,h].
-        
         '''
-        anns = self.get_annotations(image_id = image_id, cat_ids = cat_ids)
-        return [x['bbox'] for x in anns]
+        self.__check_image_id(image_id)
+        positions = _index_positions(self.index, image_id, cat_ids)
+        return _float32_exact(self.columns['bbox'][positions]).tolist()
     
     #----------------------------------------------- 
-    def get_masks(self,image_id, cat_ids = None, mode = 'instances'):
+    def get_masks(self,image_id, cat_ids = None, mode = 'instances', order = 'last', 
+                  region = None):
         '''
         Get segmentation masks for image instanaces by id.
         
@@ -380,32 +806,344 @@ class Annotation():
         cat_ids: list[int],
           categories to output, all possible if None.
         mode: string, 
-          posible modes: 'instances', '3d array', '2d array'.
+          posible modes: 'instances', '3d array', '2d array', 'semseg', 'sparse'.
           * 'instances': output is the 3d ndarray in format instances x height x width.
           * '3d array':  output is the 3d ndarray in format height x width x channel,
-             where each instances have random color, adobted for visualization.
+             where each instances have random color from seeded palette,
+             adobted for visualization (see label_map2image).
           * '2d array':  output is the 2d ndarray in format height x width,
-             where each instant have different value in range from 0 to max.
+             where each instant have different value in range from 0 to max,
+             dtype is uint8, uint16 or uint32 depending on the number of instances.
           * 'semseg':  output is the 2d ndarray in format height x width,
              where each instant have same value 1.
+          * 'sparse':  output is the list of 2d crops of instances masks
+             and ndarray of crops offsets (x0,y0), see get_sparse_masks.
+        order: string,
+          z-order for overlaped instances in '2d array' and '3d array' modes:
+          * 'last': the instance painted last (larger index) is selected;
+          * 'area': the instance with larger area is selected.
+        region: tuple(int,int,int,int),
+          window (x0,y0,w,h) of the image, whole image if None;
+          output has the shape of the window and only instances
+          intersecting the window are rasterized; labels (and colors)
+          in '2d array' and '3d array' modes are the same as for 
+          the whole image (index of instance in the image + 1).
         Returns
         ----------
         ndarray: image like array .
         
         '''        
-        anns = self.get_annotations(image_id = image_id, 
-                                    cat_ids  = cat_ids)
         img_desc = self.get_image_descriptor(image_id)
+        crops, offsets, labels, areas = self.__sparse_masks(image_id, cat_ids, region)
+        shape = (img_desc['height'], img_desc['width'])
+        if region is not None:
+            x0, y0, x1, y1 = _region_box(region, shape[1], shape[0])
+            shape = (y1 - y0, x1 - x0)
+        return _sparse2mode(crops, offsets, shape, mode, order, labels, areas)
+
+    #----------------------------------------------- 
+    def iter_masks(self, image_ids = None, cat_ids = None, mode = 'semseg', 
+                   order = 'last', n_jobs = None, chunk_size = 8):
+        '''
+        Get segmentation masks for many images, 
+          computed in parallel by process pool.
+        
+        Parameters
+        ----------
+        image_ids: list[int],
+          images to select, all if None.
+        cat_ids: list[int],
+          categories to output, all possible if None.
+        mode: string, 
+          posible modes: 'instances', '3d array', '2d array', 'semseg', 'sparse',
+          see get_masks.
+        order: string,
+          z-order for overlaped instances, see get_masks.
+        n_jobs: int,
+          number of processes, all cpu if None,
+          if 1, masks are computed in the current process.
+        chunk_size: int,
+          number of images in each output chunk.
+
+        Returns
+        ----------
+        generator[list[tuple(int, ndarray)]]: chunks of pairs 
+          (image_id, masks) in the order of image_ids.
+
+        Examples
+        ---------
+        >>> for chunk in anno.iter_masks(mode = 'semseg', n_jobs = 4):
+        >>>     for image_id, mask in chunk:
+        >>>         ...
+
+        Notes
+        --------
+        only two chunks of masks are kept in memory at once.
+          With vertex store (see set_vertex_store) workers read
+          polygons from memory-mapped file.
+          With mask cache (see set_mask_cache) cache is read and 
+          written once per chunk, instances missed in cache are
+          rasterized by workers.
+        '''
+        if image_ids is None: image_ids = [x['id'] for x in self.data['images']]
+        image_ids = np.atleast_1d(image_ids).astype(int).tolist()
+        for image_id in image_ids: self.__check_image_id(image_id)
+        mapped       = _is_mapped(self.columns, self.vertex_store)
+        segmentation = self.__segmentation_ref if mapped else self.__segmentation
+        chunk_size   = max(int(chunk_size), 1)
+        ids = iter(image_ids)
+
+        if self.mask_cache is None:
+            def tasks():
+                for image_id in image_ids:
+                    img_desc  = self.get_image_descriptor(image_id)
+                    positions = _index_positions(self.index, image_id, cat_ids)
+                    yield ([segmentation(i) for i in positions], 
+                           img_desc['height'], img_desc['width'], mode, order)
+
+            for chunk in _iter_masks(tasks(), n_jobs = n_jobs, chunk_size = chunk_size):
+                yield [(next(ids), masks) for masks in chunk]
+            return
+
+        # WITH MASK CACHE: ONE LOOKUP AND ONE WRITE PER CHUNK,
+        # MISSED INSTANCES ARE RASTERIZED BY WORKERS
+        pending = deque() # KEYS OF MISSED INSTANCES OF EACH CHUNK IN WORK
+        def tasks():
+            for chunk_ids in _iter_chunks(image_ids, chunk_size):
+                images, keys = [], []
+                for image_id in chunk_ids:
+                    img_desc  = self.get_image_descriptor(image_id)
+                    h, w      = img_desc['height'], img_desc['width']
+                    positions = _index_positions(self.index, image_id, cat_ids)
+                    images.append((h, w, positions, len(keys)))
+                    keys += [(image_id, anno_id, self.__segm_hash(i, h, w)) for i, anno_id 
+                                in zip(positions, self.columns['id'][positions].tolist())]
+                rles = self.mask_cache.get_many(keys)
+                chunk, missed_keys = [], []
+                for h, w, positions, start in images:
+                    segms, missed = [], []
+                    for j, i in enumerate(positions):
+                        rle = rles[start + j]
+                        if rle is None:
+                            missed.append(j)
+                            missed_keys.append(keys[start + j])
+                            rle = segmentation(i)
+                        segms.append(rle)
+                    chunk.append((segms, h, w, mode, order, missed))
+                pending.append(missed_keys)
+                yield from chunk
+
+        for chunk in _iter_masks(tasks(), n_jobs = n_jobs, chunk_size = chunk_size,
+                                 worker = _cached_masks_task):
+            self.mask_cache.put_many(pending.popleft(), [rle for _, rles in chunk for rle in rles])
+            self.report['mask_cache'] = self.mask_cache.stats()
+            yield [(next(ids), masks) for masks, _ in chunk]
 
-        h = img_desc['height'] 
-        w = img_desc['width' ]
+    #----------------------------------------------- 
+    def get_sparse_masks(self, image_id, cat_ids = None, region = None):
+        '''
+        Get segmentation masks for image instanaces by id,
+          each mask is decoded only inside the instance bounding box.
         
-        out = np.asarray([_ann2mask(ann,h,w) for ann in anns])
-        if mode == '3d array': out = _masks2image(out)
-        if mode == '2d array': out = _masks2d(out)
-        if mode == 'semseg': out = _masks2d(out); out[out>0]=1
-        return out #, dtype = np.int8)
-    #---------------------------------------------- 
+        Parameters
+        ----------
+        image_id: int,
+          images to select, start from 1.
+        cat_ids: list[int],
+          categories to output, all possible if None.
+        region: tuple(int,int,int,int),
+          window (x0,y0,w,h) of the image, whole image if None;
+          only instances with bbox intersecting window are 
+          rasterized, crops are clipped by window.
+
+        Returns
+        ----------
+        list[ndarray]: 2d binary crops of instances masks.
+        ndarray: offsets (x0,y0) of crops in the image 
+          (in the window if region is set), N x 2.
+
+        Notes
+        ---------
+        use paste_mask to draw crop into canvas 
+          and sparse2dense to get instances x height x width array.
+        '''
+        return self.__sparse_masks(image_id, cat_ids, region)[:2]
+
+    # DATASET ARRAYS
+    #-----------------------------------------------
+    def get_anno_arrays(self, image_ids = None, cat_ids = None):
+        '''
+        Get annotation fields for set of images as arrays,
+          one row per annotation.
+
+        Parameters
+        ----------
+        image_ids: int; list[int],
+          images to select, all if None.
+        cat_ids: list[int],
+          categories to output, all possible if None.
+
+        Returns
+        ----------
+        dict[string:ndarray]: arrays with keys:
+          * 'id': annotation ids (N);
+          * 'image_id': image ids (N);
+          * 'category_id': category ids (N);
+          * 'area': instances areas (N);
+          * 'bbox': bounding boxes (N x 4) in format [x0,y0,w,h].
+
+        Notes
+        --------
+        rows are grouped in order of image_ids,
+          selection is taken by index without scan of all annotations.
+        '''
+        positions = _index_positions(self.index, image_ids, cat_ids)
+        return {k: self.columns[k][positions]
+                   for k in ('id', 'image_id', 'category_id', 'area', 'bbox')}
+
+    #-----------------------------------------------
+    def get_bboxes_array(self, image_ids = None, cat_ids = None):
+        '''
+        Get bounding boxes for set of images as one array.
+
+        Parameters
+        ----------
+        image_ids: int; list[int],
+          images to select, all if None.
+        cat_ids: list[int],
+          categories to output, all possible if None.
+
+        Returns
+        ----------
+        ndarray: bounding boxes (N x 4) in format [x0,y0,w,h].
+        ndarray: image id for each box (N).
+        ndarray: category id for each box (N).
+
+        Examples
+        ---------
+        >>> bboxes, image_ids, cat_ids = anno.get_bboxes_array()
+        >>> small = bboxes[(bboxes[:,2]*bboxes[:,3]) < 32**2]
+        '''
+        arrays = self.get_anno_arrays(image_ids, cat_ids)
+        return arrays['bbox'], arrays['image_id'], arrays['category_id']
+
+    #-----------------------------------------------
+    def get_areas_array(self, image_ids = None, cat_ids = None):
+        '''
+        Get instances areas for set of images as one array.
+
+        Parameters
+        ----------
+        image_ids: int; list[int],
+          images to select, all if None.
+        cat_ids: list[int],
+          categories to output, all possible if None.
+
+        Returns
+        ----------
+        ndarray: areas (N).
+        ndarray: image id for each instance (N).
+        ndarray: category id for each instance (N).
+        '''
+        arrays = self.get_anno_arrays(image_ids, cat_ids)
+        return arrays['area'], arrays['image_id'], arrays['category_id']
+
+    # RLE
+    #-----------------------------------------------
+    def get_rles(self, image_id, cat_ids = None):
+        '''
+        Get instances masks of image as RLE (pycocotools format),
+          without dense decoding.
+
+        Parameters
+        ----------
+        image_id: int,
+          images to select, start from 1.
+        cat_ids: list[int],
+          categories to output, all possible if None.
+
+        Returns
+        ----------
+        list[dict]: RLE for each instance.
+        '''
+        self.__check_image_id(image_id)
+        positions = _index_positions(self.index, image_id, cat_ids)
+        return self.__instance_rles(image_id, positions)
+
+    #-----------------------------------------------
+    def get_coverage(self, image_ids = None, cat_ids = None):
+        '''
+        Get fraction of image area covered by instances 
+          (union of masks) for each image.
+
+        Parameters
+        ----------
+        image_ids: list[int],
+          images to select, all if None.
+        cat_ids: list[int],
+          categories to output, all possible if None.
+
+        Returns
+        ----------
+        ndarray[float]: coverage for each image in order of image_ids.
+        '''
+        if image_ids is None: image_ids = [x['id'] for x in self.data['images']]
+        coverage = []
+        for image_id in np.atleast_1d(image_ids).astype(int):
+            img_desc = self.get_image_descriptor(image_id)
+            coverage.append(rle_coverage(self.get_rles(image_id, cat_ids), 
+                                         img_desc['height'], img_desc['width']))
+        return np.asarray(coverage, dtype = float)
+
+    #-----------------------------------------------
+    def get_iou_matrix(self, image_id, cat_ids = None):
+        '''
+        Get pairwise IoU of image instances computed on RLE.
+
+        Parameters
+        ----------
+        image_id: int,
+          images to select, start from 1.
+        cat_ids: list[int],
+          categories to output, all possible if None.
+
+        Returns
+        ----------
+        ndarray: N x N IoU matrix in order of get_annotations.
+        '''
+        return rle_iou(self.get_rles(image_id, cat_ids))
+
+    #-----------------------------------------------
+    def find_duplicates(self, image_ids = None, cat_ids = None, iou_threshold = 0.9):
+        '''
+        Find pairs of instances with IoU over threshold 
+          (possible duplicated labels).
+
+        Parameters
+        ----------
+        image_ids: list[int],
+          images to check, all if None.
+        cat_ids: list[int],
+          categories to check, all possible if None.
+        iou_threshold: float,
+          minimal IoU for the pair to be reported.
+
+        Returns
+        ----------
+        pd.DataFrame: report with columns 
+          'image_id', 'anno_id', 'duplicate_id', 'iou'.
+        '''
+        if image_ids is None: image_ids = [x['id'] for x in self.data['images']]
+        report = []
+        for image_id in np.atleast_1d(image_ids).astype(int):
+            positions = _index_positions(self.index, image_id, cat_ids)
+            iou = np.triu(self.get_iou_matrix(image_id, cat_ids), k = 1)
+            ids = self.columns['id'][positions]
+            for i, j in zip(*np.nonzero(iou >= iou_threshold)):
+                report.append([int(image_id), int(ids[i]), int(ids[j]), float(iou[i, j])])
+        return pd.DataFrame(report, columns = ['image_id', 'anno_id', 'duplicate_id', 'iou'])
+
+    #----------------------------------------------
     def get_image_with_bbox(self, image_id = 1, cat_ids = None, color =0, thikness = 10):
         '''
         Get image with drawn bounding boxes.
@@ -429,10 +1167,167 @@ class Annotation():
         img = self.get_image(image_id)
         bboxes = self.get_bboxes(image_id, cat_ids)
         if bboxes:
+          if self.image_cache is not None or not img.flags.writeable \
+             or not img.flags.c_contiguous:
+              img = np.array(img) # COPY ON WRITE, CACHED OR MAPPED FRAME IS NOT CHANGED
           return _image_with_bbox(img, bboxes, color, thikness)
         else:
           return img
     #----------------------------------------------
     def __check_image_id(self, image_id):
-        if image_id<1 or image_id > len(self.data['images']):
-            raise ValueError(f'image_id {image_id} image_id<1 or image_id > len(data[images])')
\ No newline at end of file
+        if _image_position(self.index, image_id) is None:
+            raise ValueError(f'image_id {image_id} is not in data[images]')
+
+    #----------------------------------------------
+    def __instance_rles(self, image_id, positions):
+        ''' RLE of annotations at positions in columns store, 
+            taken from mask cache if it is set.'''
+        img_desc = self.get_image_descriptor(image_id)
+        h, w     = img_desc['height'], img_desc['width']
+        if self.mask_cache is None:
+            return [segm2rle(self.__segmentation(i), h, w) for i in positions]
+
+        keys   = [(image_id, anno_id, self.__segm_hash(i, h, w)) for i, anno_id
+                     in zip(positions, self.columns['id'][positions].tolist())]
+        rles   = self.mask_cache.get_many(keys)
+        missed = [j for j, rle in enumerate(rles) if rle is None]
+        for j in missed:
+            rles[j] = segm2rle(self.__segmentation(positions[j]), h, w)
+        self.mask_cache.put_many([keys[j] for j in missed], [rles[j] for j in missed])
+        self.report['mask_cache'] = self.mask_cache.stats()
+        return rles
+
+    #----------------------------------------------
+    def __build_index(self):
+        ''' Rebuild index of annotations by image and category ids,
+            should be called after each change of data.'''
+        self.index = _build_index(self.columns['image_id'], 
+                                  self.columns['category_id'], 
+                                  self.data['images'])
+        _, counts = np.unique(self.columns['image_id'], return_counts=True)
+        self.counts_anno = list(counts.astype(int))
+
+    #----------------------------------------------
+    def __transform(self, op, params, output_dir = None, n_jobs = None, journal = None):
+        ''' Transform images (in place or into output_dir) and 
+            annotations geometry from frame of image descriptors
+            (width, height); returns report of transform with 
+            'size_mismatch' - images whose output size differs 
+            from planned by descriptor.'''
+        images   = self.data['images']
+        img_pths, dst_pths = self.__output_pathes(output_dir)
+        if output_dir is not None and journal is None:
+            journal = _manifest_path(output_dir)
+
+        report_list, timing, sizes, out_sizes = _transform_images(img_pths, op, params,
+                                                                  n_jobs, journal, dst_pths)
+
+        # COORDINATES TRANSFORM OF EACH IMAGE FROM DESCRIPTOR FRAME:
+        # SIZES OF FILES MAY BE ALREADY TRANSFORMED (RESUMED OR REPEATED RUN)
+        steps  = _op_steps(op, params)
+        frames = [(int(x.get('width') or size[0]), int(x.get('height') or size[1])) 
+                     for x, size in zip(images, sizes)]
+        plans  = [_plan_steps(steps, None, frame) for frame in frames]
+        out_pths = img_pths if dst_pths is None else dst_pths
+        mismatch = [pth for pth, out_size, plan in zip(out_pths, out_sizes, plans)
+                       if tuple(out_size) != tuple(plan[1])]
+        affine = np.asarray([plan[2] for plan in plans] + [(1., 1., 0., 0.)], dtype=np.float64)
+        pos    = _image_positions(self.index, self.columns['image_id'])
+        self.columns = _scale_columns(self.columns, *affine[pos].T)
+
+        cropped = any(name == 'crop' for name, _ in steps)
+        extras, extra_index = list(self.columns['extras']), self.columns['extra_index'].copy()
+        for i in np.flatnonzero(['segmentation' in extras[k] for k in extra_index]):
+            if pos[i] < 0: continue
+            w, h  = frames[pos[i]]
+            segm  = _transform_rle(extras[extra_index[i]]['segmentation'], h, w,
+                                   lambda mask: _steps2mask(mask, steps))
+            extra = {**extras[extra_index[i]], 'segmentation': segm}
+            extra_index[i] = len(extras)
+            extras.append(extra)
+            if cropped: # GEOMETRY OF CROPPED MASK
+                self.columns['area'][i] = rle_area([segm])[0]
+                self.columns['bbox'][i] = rle_bbox([segm])[0]
+        self.columns.update({'extras': extras, 'extra_index': extra_index})
+
+        dropped = []
+        if cropped: # CLIP BY NEW FRAMES, DROP INSTANCES FULLY OUTSIDE
+            size = np.asarray([plan[1] for plan in plans] + [(np.inf, np.inf)], dtype=np.float64)[pos]
+            self.columns, keep = _clip_columns(self.columns, size[:, 0], size[:, 1])
+            dropped = self.columns['id'][~keep].tolist()
+            if len(dropped) > 0:
+                self.columns = _take_columns(self.columns, keep)
+
+        for x, plan in zip(images, plans):
+            x['width'], x['height'] = plan[1]
+        if output_dir is not None:
+            self.__set_output_pathes(output_dir, dst_pths)
+        if len(dropped) > 0: self.__build_index()
+        return {'changed': report_list, **timing, 'size_mismatch': mismatch, 'dropped': dropped}
+
+    #----------------------------------------------
+    def __output_pathes(self, output_dir = None):
+        ''' Source image pathes and their pathes in output_dir
+            (None if output_dir is None).'''
+        images   = self.data['images']
+        img_pths = [os.path.join(self.image_dir_path, x['file_name']) for x in images]
+        if output_dir is None: return img_pths, None
+        dst_pths = [os.path.join(output_dir, _image_fname(x['file_name'])) for x in images]
+        if len(set(dst_pths)) < len(dst_pths):
+            raise ValueError(f'image file names are not unique in {output_dir}')
+        return img_pths, dst_pths
+
+    def __set_output_pathes(self, output_dir, dst_pths):
+        ''' Point image descriptors to images in output_dir
+            (absolute pathes, so file_name is valid both alone 
+            and joined with image_dir_path).'''
+        for x, dst_pth in zip(self.data['images'], dst_pths):
+            x['file_name'] = os.path.abspath(dst_pth)
+        self.image_dir_path = os.path.abspath(output_dir)
+
+    #----------------------------------------------
+    def __sparse_masks(self, image_id, cat_ids = None, region = None):
+        ''' Crops and offsets of instances masks (see get_sparse_masks),
+            labels (index in the whole image + 1) and areas of whole masks, 
+            so label maps of windows are the same as of the whole image.'''
+        img_desc  = self.get_image_descriptor(image_id)
+        positions = _index_positions(self.index, image_id, cat_ids)
+        labels    = np.arange(1, len(positions) + 1)
+        if region is not None:
+            box = _region_box(region, img_desc['width'], img_desc['height'])
+            bbox = self.columns['bbox'][positions]
+            inside = (bbox[:,0] - 1 < box[2]) & (bbox[:,0] + bbox[:,2] + 1 > box[0]) & \
+                     (bbox[:,1] - 1 < box[3]) & (bbox[:,1] + bbox[:,3] + 1 > box[1])
+            positions, labels = positions[inside], labels[inside]
+
+        crops, offsets = [], np.zeros((len(positions), 2), dtype=np.int64)
+        areas = np.zeros(len(positions), dtype=np.int64)
+        for i, rle in enumerate(self.__instance_rles(image_id, positions)):
+            crop, offsets[i] = _rle2crop(rle)
+            areas[i] = np.count_nonzero(crop)
+            if region is not None:
+                crop, offsets[i] = _crop2region(crop, offsets[i], box)
+            crops.append(crop)
+        return crops, offsets, labels, areas
+
+    #----------------------------------------------
+    def __segmentation(self, position):
+        ''' Segmentation of annotation at position in columns store:
+            list of polygons or RLE.'''
+        extra = self.columns['extras'][self.columns['extra_index'][position]]
+        if 'segmentation' in extra: return extra['segmentation']
+        return [_float32_exact(poly) for poly in _anno_polygons(self.columns, position)]
+
+    def __segm_hash(self, position, h, w):
+        ''' Hash of segmentation of annotation at position (see _segm_hash),
+            polygons are hashed as float32 buffers without conversion.'''
+        extra = self.columns['extras'][self.columns['extra_index'][position]]
+        if 'segmentation' in extra: return _segm_hash(extra['segmentation'], h, w)
+        return _segm_hash(_anno_polygons(self.columns, position), h, w)
+
+    def __segmentation_ref(self, position):
+        ''' Segmentation of annotation at position: RLE or reference
+            to polygons in vertex store (see _polygon_ref).'''
+        extra = self.columns['extras'][self.columns['extra_index'][position]]
+        if 'segmentation' in extra: return extra['segmentation']
+        return _polygon_ref(self.columns, position, self.vertex_store)
\ No newline at end of file
@@ -5,9 +5,15 @@ import json
 import pandas as pd
 from pycocotools import mask as cocoutils
 
+from ._anno_index import _index_positions
+from ._anno_columns import _take_columns
+from ._jsonio import _load
+
 __all__ = ['_open','_set_cat_names','_cat_ids','_filter_cat','_replace_image_dir',
            '_get_data_info','_count_anno_at_images', '_most_frequent_size', '_image_list',
-           '_df2anno', '_data_head', '_data2df']
+           '_df2anno', '_data_head', '_data2df', '_image_fname', '_filter_cat_columns']
+
+EMPTY_IMAGES = ('drop', 'keep', 'drop_filtered')
 #---------------------------------------
 def _open(anno_path):
     ''' Open data in json format
@@ -21,10 +27,7 @@ def _open(anno_path):
     dict[list[dict]],
       coco format dict for json save.
     '''
-    with open(anno_path) as json_file:
-        data = json.load(json_file)
-        json_file.close()
-    return data
+    return _load(anno_path)
 #---------------------------------------
 def _set_cat_names(data, new_names):
     '''Set categories (class) names
@@ -171,7 +174,7 @@ def _df2anno(anno_df, data_head, anno_keys, img_keys):
     
     return data
 
-def _filter_cat(data, cat_ids = None):
+def _filter_cat(data, cat_ids = None, empty_images = 'drop'):
     ''' Select only instasnce for category,
     if cat is None, select all labeld instances.
     
@@ -181,20 +184,97 @@ def _filter_cat(data, cat_ids = None):
       coco format dict from json.
     cat_ids: list[string],
       new category id, all for classes (categories).
+    empty_images: string,
+      policy for images without annotations after filter:
+      'drop' - remove them; 'keep' - keep all images;
+      'drop_filtered' - remove only images which lost
+      all annotations by filter.
       
     Returns
     ----------
     dict[list[dict]],
       coco format dict for json save.
     ''' 
-    cat_ids, data = _cat_ids(data = data, cat_ids = cat_ids)
-    cat_ids = list(np.atleast_1d(cat_ids)[:].astype(int))
-    anno_df = _data2df(data)
-    anno_df = anno_df.loc[anno_df['category_id'].isin(cat_ids)]
-    data_head, anno_keys, img_keys = _data_head(data)
-    data = _df2anno(anno_df, data_head, anno_keys, img_keys)
+    _check_empty_images(empty_images)
+    cat_ids, data = _cat_ids(data = dict(data), cat_ids = cat_ids)
+    cat_ids   = set(np.atleast_1d(cat_ids).astype(int).tolist())
+    image_ids = set(x['id'] for x in data['images'])
+    annotations = [x for x in data['annotations'] 
+                     if x['category_id'] in cat_ids and x['image_id'] in image_ids]
+    data['images'] = _filter_images(data['images'], 
+                                    [x['image_id'] for x in annotations],
+                                    [x['image_id'] for x in data['annotations']],
+                                    empty_images)
+    data['annotations'] = annotations
     return data
 
+def _filter_cat_columns(data, columns, index, cat_ids = None, empty_images = 'drop'):
+    ''' Select only instasnce for category by index of annotations,
+    only selected polygons are gathered from columns store.
+    
+    Parameters
+    ----------
+    data: dict[list[dict]], 
+      coco format dict without annotations.
+    columns: dict[string:ndarray],
+      columns store, see _anno_columns._ColumnsBuilder.
+    index: dict,
+      index of annotations, see _anno_index._build_index.
+    cat_ids: list[string],
+      new category id, all for classes (categories).
+    empty_images: string,
+      policy for images without annotations after filter, 
+      see _filter_cat.
+      
+    Returns
+    ----------
+    dict[list[dict]],
+      coco format dict without annotations.
+    dict[string:ndarray]: columns store.
+    ''' 
+    _check_empty_images(empty_images)
+    cat_ids, data = _cat_ids(data = dict(data), cat_ids = cat_ids)
+    positions = _index_positions(index, cat_ids = np.atleast_1d(cat_ids).astype(int))
+    image_ids = np.fromiter((x['id'] for x in data['images']), 
+                            dtype=np.int64, count=len(data['images']))
+    positions = positions[np.isin(columns['image_id'][positions], image_ids)]
+    data['images'] = _filter_images(data['images'], 
+                                    columns['image_id'][positions].tolist(),
+                                    columns['image_id'].tolist(),
+                                    empty_images)
+    return data, _take_columns(columns, positions)
+
+def _filter_images(images, image_ids, old_image_ids, empty_images = 'drop'):
+    '''Images by policy for images without annotations.
+    Parameters
+    ----------
+    images: list[dict],
+      images descriptors.
+    image_ids: list[int],
+      image ids of annotations after filter.
+    old_image_ids: list[int],
+      image ids of annotations before filter.
+    empty_images: string,
+      policy, see _filter_cat.
+    '''
+    if empty_images == 'keep': return images
+    if empty_images == 'drop_filtered':
+        lost = set(old_image_ids) - set(image_ids)
+        return [x for x in images if x['id'] not in lost]
+    # IMAGES IN ORDER OF ANNOTATIONS, THE FIRST FOR DUPLICATED FILE NAMES
+    images = {x['id']:x for x in reversed(images)}
+    fnames, out = set(), []
+    for image_id in dict.fromkeys(image_ids):
+        x = images[image_id]
+        if x['file_name'] in fnames: continue
+        fnames.add(x['file_name'])
+        out.append(x)
+    return out
+
+def _check_empty_images(empty_images):
+    if empty_images not in EMPTY_IMAGES:
+        raise ValueError(f'empty_images should be one of {EMPTY_IMAGES}, got {empty_images}')
+
 #---------------------------------------
 def _replace_image_dir(data, new_dir=''):
     ''' Replace image directory in field filename.
@@ -212,11 +292,15 @@ def _replace_image_dir(data, new_dir=''):
       coco format dict for json save.
     '''    
     for i in range(len(data['images'])):
-        fname = os.path.basename(data['images'][i]['file_name']).split('\\')[-1].split('/')[-1]
+        fname = _image_fname(data['images'][i]['file_name'])
         # fname = os.path.split(data['images'][0]['file_name'])[-1]
         data['images'][i]['file_name'] = os.path.join(new_dir, fname)
     return data
 
+def _image_fname(file_name):
+    ''' Image file name without directory (both path separators).'''
+    return os.path.basename(file_name).split('\\')[-1].split('/')[-1]
+
 #---------------------------------------
 def _get_data_info(data):
     '''Information about data in json coco format.
@@ -238,7 +322,7 @@ def _get_data_info(data):
     desc['width']         = list({x['width'] for x in data['images']})
     desc['height']        = list({x['height'] for x in data['images']})
     desc['length']      = len(data['images'])
-    desc['anno_number'] = len(data['annotations'])
+    desc['anno_number'] = len(data.get('annotations', []))
     desc['fname_example']  = data['images'][0]['file_name'] 
     image_dir_path = os.path.split(desc['fname_example'])[0]
     name_dataset   = os.path.split(image_dir_path)[-1]
@@ -0,0 +1,87 @@
+import struct
+import numpy as np
+
+__all__ = ['_bmp_header', '_read_bmp']
+
+BMP_INFO_HEADERS = (40, 52, 56, 108, 124)
+BI_RGB = 0
+
+#-----------------------------------
+def _bmp_header(img_pth):
+    '''Parse header of BMP file.
+    Parameters
+    -----------
+    img_pth: string,
+      image path.
+
+    Returns
+    --------
+    dict: header fields 'width', 'height', 'bpp', 'compression',
+      'offset' (start of pixel array), 'top_down', 'palette';
+      None if file is not BMP with info header.
+    '''
+    with open(img_pth, 'rb') as f:
+        head = f.read(14 + 124)
+        if len(head) < 14 + 40 or head[:2] != b'BM': return None
+        offset, dib_size = struct.unpack_from('<II', head, 10)
+        if dib_size not in BMP_INFO_HEADERS: return None
+        width, height, _, bpp, compression = struct.unpack_from('<iiHHI', head, 18)
+        colors = struct.unpack_from('<I', head, 46)[0]
+        palette = None
+        if bpp <= 8:
+            colors = colors or 2**bpp
+            f.seek(14 + dib_size)
+            palette = np.frombuffer(f.read(4*colors), dtype=np.uint8).reshape(-1, 4)[:, 2::-1]
+    return {'width': width, 'height': abs(height), 'bpp': bpp,
+            'compression': compression, 'offset': offset,
+            'top_down': height < 0, 'palette': palette}
+
+#-----------------------------------
+def _read_bmp(img_pth, header = None):
+    '''Read uncompressed BMP as view of memory-mapped file
+        (no copy of pixel data, only required pages are read).
+    Parameters
+    -----------
+    img_pth: string,
+      image path.
+    header: dict,
+      parsed header, see _bmp_header.
+
+    Returns
+    --------
+    ndarray: image height x width (8 bit gray)
+      or height x width x 3 (24, 32 bit, RGB channel order)
+      backed by np.memmap in copy-on-write mode;
+      None if format is not supported by fast path
+      (PIL should be used).
+
+    Notes
+    ------
+    bottom-up rows are handled by negative-stride view,
+      BGR order by reverse view of channels,
+      result is the same as np.array(Image.open(img_pth)).
+    '''
+    if header is None: header = _bmp_header(img_pth)
+    if header is None or header['compression'] != BI_RGB: return None
+    h, w, bpp = header['height'], header['width'], header['bpp']
+
+    if bpp == 8:
+        palette = header['palette']
+        if len(palette) != 256 or \
+           (palette != np.arange(256, dtype=np.uint8)[:, None]).any():
+            return None # NOT GRAYSCALE, PIL MODE P
+        shape = (h, w)
+    elif bpp in (24, 32):
+        shape = (h, w, bpp // 8)
+    else:
+        return None
+
+    stride = ((bpp*w + 31) // 32) * 4
+    mm = np.memmap(img_pth, dtype=np.uint8, mode='c')
+    if header['offset'] + stride*h > mm.size: return None
+    strides = (stride, 1) if bpp == 8 else (stride, bpp // 8, 1)
+    image = np.ndarray(shape, dtype=np.uint8, buffer=mm,
+                       offset=header['offset'], strides=strides)
+    if not header['top_down']: image = image[::-1]
+    if bpp > 8: image = image[..., 2::-1]
+    return image
@@ -23,12 +23,300 @@ def _ann2mask(ann, h,w):
     ndarray: numpy 2d array image mask with values:
        0 for background,1 for object.
     '''
-    segm = ann['segmentation']
-    rles = cocoutils.frPyObjects(segm, h, w)
-    rle  = cocoutils.merge(rles)
-    instant_mask = cocoutils.decode(rle)  
+    return _segm2mask(ann['segmentation'], h, w)
+
+def _segm2mask(segm, h,w):
+    '''
+    transform segmentation (polygons or RLE) into binary image,
+      with shape h, w.
+    
+    Paramters
+    ----------
+    segm: list[list[float]]; list[ndarray]; dict,
+      polygons in format [[x,y,x,y...]] or RLE.
+    h,w: int, int,
+      required output shape.  
+    
+    Returns
+    ------------
+    ndarray: numpy 2d array image mask with values:
+       0 for background,1 for object.
+    '''
+    instant_mask = cocoutils.decode(_segm2rle(segm, h, w))  
     return instant_mask
 
+def _segm2rle(segm, h,w):
+    '''
+    transform segmentation (polygons or RLE) into one 
+      compressed RLE (pycocotools format), without decoding.
+    '''
+    if isinstance(segm, dict) and isinstance(segm.get('counts'), (str, bytes)):
+        return segm
+    rles = cocoutils.frPyObjects(segm, h, w)
+    return cocoutils.merge(rles) if isinstance(rles, list) else rles
+
+#-----------------------------------
+def _transform_rle(segm, h, w, func):
+    '''
+    transform segmentation by function of binary mask
+      (resize, crop, ...), result is compressed RLE 
+      with string counts.
+    '''
+    mask = func(cocoutils.decode(_segm2rle(segm, h, w)))
+    rle  = cocoutils.encode(np.asfortranarray(mask))
+    return {'size': [int(mask.shape[0]), int(mask.shape[1])], 'counts': rle['counts'].decode()}
+
+#-----------------------------------
+def _rle_counts(rle):
+    '''
+    uncompressed runs of RLE (pycocotools format): 
+      lengths of alternating 0 and 1 runs in column-major order.
+    '''
+    counts = rle['counts']
+    if not isinstance(counts, (str, bytes)):
+        return np.asarray(counts, dtype=np.int64)
+    if isinstance(counts, str): counts = counts.encode()
+    out, p = [], 0
+    while p < len(counts):
+        x, k, more = 0, 0, True
+        while more:
+            c = counts[p] - 48
+            x |= (c & 0x1f) << 5*k
+            more = c & 0x20
+            p += 1; k += 1
+            if not more and (c & 0x10): x |= -1 << 5*k
+        if len(out) > 2: x += out[-2]
+        out.append(x)
+    return np.asarray(out, dtype=np.int64)
+
+def _rle2crop(rle):
+    '''
+    decode RLE only inside its bounding box.
+    
+    Paramters
+    ----------
+    rle: dict,
+      RLE in pycocotools format.
+    
+    Returns
+    ------------
+    ndarray: numpy 2d array crop of mask with values:
+       0 for background,1 for object.
+    tuple(int,int): offset (x0,y0) of crop in the image.
+    '''
+    h  = int(rle['size'][0])
+    x0, y0, cw, ch = cocoutils.toBbox(rle).astype(int)
+    crop = np.zeros((ch + 1, cw), dtype=np.int32)
+    if cw == 0 or ch == 0: return crop[:ch].astype(np.uint8), (int(x0), int(y0))
+
+    counts = _rle_counts(rle)
+    ends   = np.cumsum(counts)
+    starts, ends = (ends - counts)[1::2], ends[1::2]
+    starts, ends = starts[ends > starts], ends[ends > starts]
+
+    # RUNS OF ONES MAY CROSS COLUMNS: SPLIT THEM BY COLUMNS
+    c0, c1 = starts // h, (ends - 1) // h
+    nseg   = c1 - c0 + 1
+    first  = np.repeat(np.cumsum(nseg) - nseg, nseg)
+    cols   = np.repeat(c0, nseg) + np.arange(nseg.sum()) - first
+    r0 = np.maximum(np.repeat(starts, nseg), cols*h) - cols*h
+    r1 = np.minimum(np.repeat(ends,   nseg), (cols + 1)*h) - cols*h
+
+    np.add.at(crop, (r0 - y0, cols - x0),  1)
+    np.add.at(crop, (r1 - y0, cols - x0), -1)
+    return np.cumsum(crop, axis=0)[:ch].astype(np.uint8), (int(x0), int(y0))
+
+#-----------------------------------
+def _segm2crop(segm, h,w):
+    '''
+    transform segmentation (polygons or RLE) into binary image,
+      decoded only inside the instance bounding box.
+    
+    Paramters
+    ----------
+    segm: list[list[float]]; list[ndarray]; dict,
+      polygons in format [[x,y,x,y...]] or RLE.
+    h,w: int, int,
+      shape of the whole image.  
+    
+    Returns
+    ------------
+    ndarray: numpy 2d array crop of mask with values:
+       0 for background,1 for object.
+    tuple(int,int): offset (x0,y0) of crop in the image.
+
+    Note
+    -----
+    polygons are encoded into RLE for the whole image 
+      (RLE size does not depend on the image size),
+      so crop is exactly the same as the crop of _segm2mask.
+    '''
+    return _rle2crop(_segm2rle(segm, h, w))
+
+def _crop2region(crop, offset, box):
+    '''
+    clip crop of mask by window.
+    
+    Paramters
+    ----------
+    crop: ndarray,
+      2d binary crop of instance mask.
+    offset: tuple(int,int),
+      offset (x0,y0) of crop in the image.
+    box: tuple(int,int,int,int),
+      window (x0,y0,x1,y1) in the image.
+
+    Returns
+    ------------
+    ndarray: clipped crop (may be empty).
+    tuple(int,int): offset of clipped crop in the window.
+    '''
+    bx0, by0, bx1, by1 = box
+    x0, y0 = int(offset[0]), int(offset[1])
+    cx0, cy0 = max(x0, bx0), max(y0, by0)
+    cx1, cy1 = min(x0 + crop.shape[1], bx1), min(y0 + crop.shape[0], by1)
+    if cx1 <= cx0 or cy1 <= cy0:
+        return np.zeros((0,0), dtype=crop.dtype), (0, 0)
+    return crop[cy0-y0:cy1-y0, cx0-x0:cx1-x0], (cx0 - bx0, cy0 - by0)
+
+#-----------------------------------
+def paste_mask(canvas, crop, offset, value = 1):
+    '''
+    paste binary crop of instance mask into canvas.
+    
+    Paramters
+    ----------
+    canvas: ndarray,
+      2d array height x width to paste into (changed inplace).
+    crop: ndarray,
+      2d binary array, crop of instance mask.
+    offset: tuple(int,int),
+      offset (x0,y0) of crop in canvas.
+    value: int,
+      value to write for object pixels.
+
+    Returns
+    ------------
+    ndarray: canvas.
+    '''
+    x0, y0 = int(offset[0]), int(offset[1])
+    ch, cw = crop.shape[:2]
+    region = canvas[y0:y0+ch, x0:x0+cw]
+    region[crop[:region.shape[0], :region.shape[1]] > 0] = value
+    return canvas
+
+def sparse2dense(crops, offsets, shape):
+    '''
+    transform sparse instance masks (crops and offsets)
+      into 3d array instances x height x width.
+    
+    Paramters
+    ----------
+    crops: list[ndarray],
+      2d binary crops of instance masks.
+    offsets: ndarray,
+      offsets (x0,y0) of crops, N x 2.
+    shape: tuple(int,int),
+      required shape height, width.
+
+    Returns
+    ------------
+    ndarray: 3d array instances x height x width.
+    '''
+    h, w  = shape[:2]
+    masks = np.zeros((len(crops), h, w), dtype=np.uint8)
+    for mask, crop, offset in zip(masks, crops, offsets):
+        paste_mask(mask, crop, offset)
+    return masks
+
+#-----------------------------------
+def _sparse2mode(crops, offsets, shape, mode = 'instances', order = 'last', 
+                 labels = None, areas = None):
+    '''
+    transform sparse instance masks into output of required mode,
+      see Annotation.get_masks.
+    
+    Paramters
+    ----------
+    crops: list[ndarray],
+      2d binary crops of instance masks.
+    offsets: ndarray,
+      offsets (x0,y0) of crops, N x 2.
+    shape: tuple(int,int),
+      image shape height, width.
+    mode: string,
+      'instances', '3d array', '2d array', 'semseg' or 'sparse'.
+    order: string,
+      z-order for overlaped instances in '2d array' 
+      and '3d array' modes, see _paint_label_map.
+    labels, areas: ndarray,
+      labels and areas of instances, see _paint_label_map.
+
+    Returns
+    ------------
+    ndarray: image like array; 
+      tuple(list[ndarray], ndarray) for 'sparse' mode.
+    '''
+    if mode == 'sparse': return crops, offsets
+    if mode == '2d array': 
+        return _paint_label_map(crops, offsets, shape, order, labels, areas)
+    if mode == 'semseg': 
+        return (_paint_label_map(crops, offsets, shape) > 0).astype(np.uint8)
+    if mode == '3d array':
+        return label_map2image(_paint_label_map(crops, offsets, shape, order, labels, areas))
+    return sparse2dense(crops, offsets, shape)
+
+#-----------------------------------
+def _label_dtype(n):
+    ''' Smallest unsigned dtype to store labels 0..n.'''
+    if n <= np.iinfo(np.uint8).max:  return np.uint8
+    if n <= np.iinfo(np.uint16).max: return np.uint16
+    return np.uint32
+
+def _paint_label_map(crops, offsets, shape, order = 'last', labels = None, areas = None):
+    '''
+    paint sparse instance masks into 2d label map,
+      where instance i has value labels[i] (i+1 by default) 
+      and background is 0.
+    
+    Paramters
+    ----------
+    crops: list[ndarray],
+      2d binary crops of instance masks.
+    offsets: ndarray,
+      offsets (x0,y0) of crops, N x 2.
+    shape: tuple(int,int),
+      image shape height, width.
+    order: string,
+      z-order for overlaped instances:
+      * 'last': the instance with larger index is selected;
+      * 'area': the instance with larger area is selected.
+    labels: ndarray[int],
+      label of each instance, increasing with index
+      (e.g. positions in the whole image + 1), i+1 if None.
+    areas: ndarray[int],
+      areas of instances for 'area' order (of whole masks
+      if crops are clipped by window), areas of crops if None.
+
+    Returns
+    ------------
+    ndarray: 2d label map, dtype is uint8, uint16 or uint32 
+      depending on the maximal label.
+    '''
+    h, w   = shape[:2]
+    labels = np.arange(1, len(crops) + 1) if labels is None else np.asarray(labels)
+    label_map = np.zeros((h, w), dtype = _label_dtype(int(labels.max(initial = 0))))
+    z = np.arange(len(crops))
+    if order == 'area':
+        if areas is None: areas = [int(np.count_nonzero(crop)) for crop in crops]
+        z = np.argsort(areas, kind='stable')
+    elif order != 'last':
+        raise ValueError(f"order {order} is not in ['last', 'area']")
+    for i in z:
+        paste_mask(label_map, crops[i], offsets[i], value = int(labels[i]))
+    return label_map
+
+#-----------------------------------
 def _masks2image(masks):    
     '''
     transform instant masks into image
@@ -45,15 +333,52 @@ def _masks2image(masks):
     ndarray: numpy 3d array image 
       with random colors for each instat.
     '''    
-    img_ = [[x*mask for x in np.random.randint(0,255,3)] for mask in masks]
+    return label_map2image(_masks2d(masks))
+
+#-----------------------------------
+def _label_palette(n, seed = 0):
+    '''
+    palette (lookup table) for label map colorization.
+    
+    Paramters
+    ----------
+    n: int,
+      number of labels (without background).
+    seed: int,
+      seed of random colors, same seed gives same colors.
 
-    img_ = np.array(img_).sum(axis=0)
+    Returns
+    ------------
+    ndarray: uint8 array (n+1) x 3,
+      black for background (label 0).
+    '''
+    palette = np.zeros((n + 1, 3), dtype = np.uint8)
+    palette[1:] = np.random.default_rng(seed).integers(64, 256, (n, 3))
+    return palette
 
-    img_ = img_.astype(float)
-    img_ = (img_ - img_.min())/(img_.max() - img_.min())
-    img_ = (255*img_).astype(np.uint8)
+def label_map2image(label_map, seed = 0, palette = None):
+    '''
+    colorize label map by palette lookup table.
+    
+    Paramters
+    ----------
+    label_map: ndarray,
+      2d array height x width with 0 for background
+      and i+1 for instance i (see '2d array' mode of get_masks).
+    seed: int,
+      seed of random colors, same seed gives same colors.
+    palette: ndarray,
+      custom palette (labels number + 1) x 3, 
+      random palette from seed if None.
 
-    return img_.transpose((1,2,0))
+    Returns
+    ------------
+    ndarray: uint8 image height x width x 3.
+    '''
+    label_map = np.asarray(label_map)
+    if palette is None: 
+        palette = _label_palette(int(label_map.max(initial = 0)), seed)
+    return np.asarray(palette, dtype = np.uint8)[label_map]
 
 #-----------------------------------
 def _masks2d(masks):
@@ -74,15 +399,17 @@ def _masks2d(masks):
     
     Note
     -----
-    if masks are overlaped, the upper value is selected.
+    if masks are overlaped, the upper value is selected,
+      dtype is uint8, uint16 or uint32 
+      depending on the number of instances.
     '''       
-    h,w = masks.shape[1:3]
-    mask = np.zeros((h,w),dtype = np.uint8)
-    for i,mask_ in enumerate(masks):
-        mask += mask_*(i+1)
-        if mask.max()> i+1:
-            mask[mask>i+1] = i+1
-    return mask
+    masks = np.asarray(masks)
+    n, (h, w) = len(masks), masks.shape[1:3]
+    if n == 0: return np.zeros((h, w), dtype = np.uint8)
+    # INDEX OF THE LAST NONZERO MASK FOR EACH PIXEL
+    last = n - np.argmax(masks[::-1] > 0, axis = 0)
+    last[~np.any(masks, axis = 0)] = 0
+    return last.astype(_label_dtype(n))
 
 #-----------------------------------
 def _image_with_bbox(img, bboxes, color =0, thikness = 10):
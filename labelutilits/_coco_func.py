@@ -19,6 +19,7 @@ import matplotlib.colors as mcolors
 
 
 from pycocotools.coco import COCO
+from pycocotools import mask as cocoutils
 
 
 from ._annojson import *
@@ -260,10 +261,8 @@ def _anno2semantic_mask(anno, coco):
     '''
     Get masks for image instances separately as mutlichennal array.
     '''    
-    mask = coco.annToMask(anno[0])
-
-    for i in range(1,len(anno)):
-        mask += coco.annToMask(anno[i])
+    rle  = cocoutils.merge([coco.annToRLE(ann) for ann in anno], intersect = 0)
+    mask = cocoutils.decode(rle)
     mask[mask>0]=250 #TODO: work here only for one class!
 
     return mask
@@ -318,10 +317,7 @@ def _plot_all_anno(image, anno, coco, figsize):
         ax[0,1].set_title('Object Detection')
          
         # SEMANTIC SEGMENTATION
-        mask = coco.annToMask(anno[0])
-        for i in range(1,len(anno)):
-            mask += coco.annToMask(anno[i])
-        mask[mask>0]=250
+        mask = _anno2semantic_mask(anno, coco)
         ax[1,0].imshow(mask, 'gray')
         ax[1,0].axis('off')
         ax[1,0].set_title('Semantic Segmentaion')    
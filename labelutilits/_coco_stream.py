@@ -0,0 +1,287 @@
+import os
+import re
+import json
+
+from ._anno_columns import (_ColumnsBuilder,
+                            _columns2anno)
+from ._jsonio import _load, _dumps, JSON_BACKEND
+
+__all__ = ['iter_coco', 'iter_annotations', 'iter_images', 'write_coco']
+
+STREAM_FIELDS = ('images', 'annotations', 'categories')
+CHUNK_SIZE    = 2**20
+WRITE_CHUNK   = 1024 # ELEMENTS ENCODED AT ONCE
+FAST_LOAD     = 4*2**20 # FILES UP TO THIS SIZE ARE PARSED WHOLE BY ORJSON
+
+_WHITESPACE  = re.compile(r'[ \t\n\r]*')
+_DECODER     = json.JSONDecoder()
+_ARRAY_START = object() # MARKER OF STREAMED ARRAY
+
+#-----------------------------------
+class _JsonStream():
+    '''
+    Incremental reader of JSON text from file:
+      values are decoded one by one from the buffer,
+      which is refilled by chunks and trimmed after use.
+    '''
+    def __init__(self, f, chunk_size = CHUNK_SIZE):
+        self.f     = f
+        self.chunk = int(chunk_size)
+        self.buf   = ''
+        self.pos   = 0
+        self.eof   = False
+
+    def fill(self, size = None):
+        ''' Read next chunk, False at the end of file.'''
+        if self.pos > self.chunk: # DROP CONSUMED TEXT
+            self.buf, self.pos = self.buf[self.pos:], 0
+        text = self.f.read(size or self.chunk)
+        if not text:
+            self.eof = True
+            return False
+        self.buf += text
+        return True
+
+    def peek(self):
+        ''' Next non-whitespace character, '' at the end of file.'''
+        while True:
+            self.pos = _WHITESPACE.match(self.buf, self.pos).end()
+            if self.pos < len(self.buf): return self.buf[self.pos]
+            if not self.fill(): return ''
+
+    def expect(self, chars):
+        ''' Consume one of chars (punctuation) and return it.'''
+        c = self.peek()
+        if c == '' or c not in chars:
+            raise ValueError(f'expected one of {chars!r}, got {c!r} in JSON stream')
+        self.pos += 1
+        return c
+
+    def value(self):
+        ''' Decode next JSON value.'''
+        self.peek()
+        size = self.chunk
+        while True:
+            try:
+                value, end = _DECODER.raw_decode(self.buf, self.pos)
+                # VALUE AT THE END OF BUFFER (NUMBER) MAY CONTINUE IN FILE
+                if end < len(self.buf) or self.eof:
+                    self.pos = end
+                    return value
+            except json.JSONDecodeError:
+                if self.eof: raise
+            self.fill(size)
+            size *= 2
+
+#-----------------------------------
+def _iter_events(anno_path, chunk_size = CHUNK_SIZE):
+    '''
+    Walk top-level fields of COCO JSON file.
+
+    Returns
+    ------------
+    generator[tuple(string, object)]: (key, value) for fields,
+      for arrays of STREAM_FIELDS (key, _ARRAY_START)
+      and then (key, element) for each element.
+    '''
+    with open(anno_path) as f:
+        stream = _JsonStream(f, chunk_size)
+        stream.expect('{')
+        if stream.peek() == '}': return
+        while True:
+            key = stream.value()
+            stream.expect(':')
+            if key in STREAM_FIELDS and stream.peek() == '[':
+                stream.expect('[')
+                yield key, _ARRAY_START
+                if stream.peek() == ']':
+                    stream.expect(']')
+                else:
+                    while True:
+                        yield key, stream.value()
+                        if stream.expect(',]') == ']': break
+            else:
+                yield key, stream.value()
+            if stream.expect(',}') == '}': return
+
+#-----------------------------------
+def iter_coco(anno_path, fields = None, chunk_size = CHUNK_SIZE):
+    '''
+    Read COCO JSON file incrementally (without loading whole file).
+
+    Paramters
+    ----------
+    anno_path: string,
+      path to annotation file.
+    fields: list[string],
+      top-level fields to output, all if None.
+    chunk_size: int,
+      number of characters read at once.
+
+    Returns
+    ------------
+    generator[tuple(string, object)]: pairs (key, value);
+      'images', 'annotations' and 'categories' are output
+      element by element as (key, element).
+
+    Examples
+    ----------
+    for key, ann in iter_coco(anno_path, fields = ['annotations']):
+        areas.append(ann['area'])
+    '''
+    for key, value in _iter_events(anno_path, chunk_size):
+        if value is _ARRAY_START: continue
+        if fields is None or key in fields:
+            yield key, value
+
+def iter_annotations(anno_path, chunk_size = CHUNK_SIZE):
+    ''' Annotations of COCO JSON file one by one, see iter_coco.'''
+    for _, ann in iter_coco(anno_path, ('annotations',), chunk_size):
+        yield ann
+
+def iter_images(anno_path, chunk_size = CHUNK_SIZE):
+    ''' Image descriptors of COCO JSON file one by one, see iter_coco.'''
+    for _, img in iter_coco(anno_path, ('images',), chunk_size):
+        yield img
+
+#-----------------------------------
+def _load_columns(anno_path, chunk_size = CHUNK_SIZE):
+    '''
+    Read COCO JSON file incrementally, annotations are put
+      directly into the columns store (never kept as dicts).
+
+    Returns
+    ------------
+    dict: COCO fields except 'annotations'.
+    dict[string:ndarray]: columns store, see _ColumnsBuilder.
+
+    Notes
+    ------
+    if orjson is installed, files up to FAST_LOAD (4 MB) bytes 
+      are parsed whole: faster than incremental reading, but all 
+      annotations are held as python objects at once (several 
+      times the file size in memory), so larger files are read 
+      incrementally with memory bounded by chunk_size.
+    '''
+    builder = _ColumnsBuilder()
+    if JSON_BACKEND == 'orjson' and os.path.getsize(anno_path) <= FAST_LOAD:
+        data = _load(anno_path)
+        for ann in data.pop('annotations', ()): builder.append(ann)
+        return data, builder.columns()
+    data = dict()
+    for key, value in _iter_events(anno_path, chunk_size):
+        if key == 'annotations':
+            if value is not _ARRAY_START: builder.append(value)
+        elif value is _ARRAY_START:
+            data[key] = []
+        elif key in data and isinstance(data[key], list) and key in STREAM_FIELDS:
+            data[key].append(value)
+        else:
+            data[key] = value
+    return data, builder.columns()
+
+#-----------------------------------
+def _round_floats(obj, precision):
+    ''' Round all floats in nested lists and dicts.'''
+    if isinstance(obj, float): return round(obj, precision)
+    if isinstance(obj, dict):  return {k:_round_floats(v, precision) for k,v in obj.items()}
+    if isinstance(obj, (list, tuple)): return [_round_floats(v, precision) for v in obj]
+    return obj
+
+def _write_events(anno_path, events, precision = None, chunk_size = WRITE_CHUNK):
+    '''
+    Write COCO JSON file from events (see _iter_events) 
+      chunk by chunk, through temporary file and atomic rename.
+
+    Paramters
+    ----------
+    anno_path: string,
+      path to annotation file.
+    events: iterable[tuple(string, object)],
+      (key, value) for fields, (key, _ARRAY_START) and then 
+      (key, element) for arrays written element by element.
+    precision: int,
+      number of decimals for floats, not rounded if None.
+    chunk_size: int,
+      number of array elements encoded at once.
+    '''
+    tmp_pth = anno_path + '.part'
+    def encode(value):
+        if precision is not None: value = _round_floats(value, precision)
+        return _dumps(value)
+    try:
+        with open(tmp_pth, 'w') as f:
+            f.write('{')
+            first, array, chunk = True, None, []
+            def flush():
+                if chunk:
+                    f.write((',' if array[1] else '') + encode(chunk)[1:-1])
+                    array[1] = True
+                    chunk.clear()
+            for key, value in events:
+                if array is not None and key == array[0] and value is not _ARRAY_START:
+                    chunk.append(value)
+                    if len(chunk) >= chunk_size: flush()
+                    continue
+                if array is not None:
+                    flush(); f.write(']'); array = None
+                f.write(('' if first else ',') + _dumps(key) + ':')
+                first = False
+                if value is _ARRAY_START:
+                    f.write('[')
+                    array = [key, False] # KEY, NOT EMPTY
+                else:
+                    f.write(encode(value))
+            if array is not None:
+                flush(); f.write(']')
+            f.write('}')
+        os.replace(tmp_pth, anno_path)
+    finally:
+        if os.path.exists(tmp_pth): os.remove(tmp_pth)
+
+#-----------------------------------
+def _data_events(data, columns = None, chunk_size = WRITE_CHUNK):
+    ''' Events (see _iter_events) of data fields 
+        and annotations from columns store.'''
+    for key, value in data.items():
+        if key in STREAM_FIELDS and not isinstance(value, (dict, str)) \
+           and hasattr(value, '__iter__'):
+            yield key, _ARRAY_START
+            for element in value:
+                yield key, element
+        else:
+            yield key, value
+    if columns is not None:
+        yield 'annotations', _ARRAY_START
+        n = len(columns['id'])
+        for start in range(0, n, chunk_size): # ONLY ONE CHUNK OF DICTS IN MEMORY
+            for ann in _columns2anno(columns, range(start, min(start + chunk_size, n))):
+                yield 'annotations', ann
+
+def write_coco(anno_path, data, columns = None, precision = None, chunk_size = WRITE_CHUNK):
+    '''
+    Write COCO JSON file incrementally with compact separators,
+      through temporary file and atomic rename.
+
+    Paramters
+    ----------
+    anno_path: string,
+      path to annotation file.
+    data: dict,
+      COCO fields in output order; 'images', 'annotations' and
+      'categories' may be any iterables (e.g. generators), 
+      they are encoded by chunks.
+    columns: dict[string:ndarray],
+      columns store (see _ColumnsBuilder) written 
+      as 'annotations' after data fields.
+    precision: int,
+      number of decimals for floats, not rounded if None.
+    chunk_size: int,
+      number of array elements encoded at once.
+
+    Returns
+    ------------
+    string: anno_path.
+    '''
+    _write_events(anno_path, _data_events(data, columns, chunk_size), precision, chunk_size)
+    return anno_path
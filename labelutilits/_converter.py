@@ -2,6 +2,8 @@ import numpy as np
 import os
 import pandas as pd
 from ._path import list_ext, list_images
+from ._image_meta import _probe_image, _probe_images
+from ._coco_stream import write_coco
 from pathlib import Path
 from PIL import Image
 import json
@@ -43,16 +45,15 @@ class Yolo2Coco():
 
     def get_image_hw(self,  image_name):
         '''
-            Get image height and weight
+            Get image height and weight,
+            only image header is read, result is cached.
             Returns
             ----------
             height: int
             weight: int
         '''
-        image_path = self.get_image_path(image_name)
-        image = np.array(Image.open(image_path))
-        height, weight = image.shape[0], image.shape[1]
-        return height, weight
+        meta = _probe_image(self.get_image_path(image_name))
+        return meta['height'], meta['width']
 
 
 
@@ -64,6 +65,7 @@ class Yolo2Coco():
         """
         images = []
         img_id = 1
+        _probe_images(list(self.image_paths.values())) # FILL SIZE CACHE IN PARALLEL
         for f_path in self.image_paths.values():
             h, w = self.get_image_hw(Path(f_path).stem)
             image_dict = {"id"           : img_id, 
@@ -152,5 +154,4 @@ class Yolo2Coco():
             "annotations": annotations,
             "categories" : categories,
         }
-        with open(self.path_save_json,'w') as f:
-            json.dump(data,f)
\ No newline at end of file
+        write_coco(self.path_save_json, data)
\ No newline at end of file
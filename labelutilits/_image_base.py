@@ -4,33 +4,109 @@ import numpy as np
 import json
 from PIL import Image
 
+from ._bmp import _read_bmp
+from ._image_transform import _transform_images
+
+#-----------------------------------
+def _read_image(img_pth, mmap = True):
+    '''Read image as numpy array.
+    Parameters
+    -----------
+    img_pth: string,
+      image path.
+    mmap: bool,
+      if True, uncompressed BMP is returned as view
+      of memory-mapped file (see _read_bmp),
+      other formats are read by PIL.
+    
+    Returns
+    --------
+    ndarray: image.
+    '''
+    if mmap and os.path.splitext(img_pth)[1].lower() == '.bmp':
+        image = _read_bmp(img_pth)
+        if image is not None: return image
+    with Image.open(img_pth) as img:
+        return np.array(img)
+
+#-----------------------------------
+def _region_box(region, width, height):
+    '''Clip region (x0,y0,w,h) to image size.
+    Returns
+    --------
+    tuple(int,int,int,int): box (x0,y0,x1,y1) inside image.
+    '''
+    x0, y0, w, h = [int(round(v)) for v in region[:4]]
+    x1, y1 = min(max(x0 + w, 0), width), min(max(y0 + h, 0), height)
+    x0, y0 = min(max(x0, 0), x1), min(max(y0, 0), y1)
+    return x0, y0, x1, y1
+
+def _read_image_region(img_pth, region, mmap = True):
+    '''Read only rectangle region of image, where format allows it.
+    Parameters
+    -----------
+    img_pth: string,
+      image path.
+    region: tuple(int,int,int,int),
+      region in format (x0,y0,w,h) as bbox,
+      it is clipped by image bounds.
+    mmap: bool,
+      if True, uncompressed BMP is sliced from 
+      memory-mapped file (see _read_bmp).
+    
+    Returns
+    --------
+    ndarray: image region.
+
+    Notes
+    ------
+    * uncompressed BMP: slice of memory-mapped view;
+    * TIFF (tiled or stripped, uncompressed) and other formats
+      decoded by PIL tiles: only tiles intersecting region are decoded;
+    * other formats: lazy PIL open and crop.
+    '''
+    if mmap and os.path.splitext(img_pth)[1].lower() == '.bmp':
+        image = _read_bmp(img_pth)
+        if image is not None:
+            x0, y0, x1, y1 = _region_box(region, image.shape[1], image.shape[0])
+            return image[y0:y1, x0:x1]
+
+    with Image.open(img_pth) as img:
+        x0, y0, x1, y1 = _region_box(region, *img.size)
+        tiles = [tile for tile in (img.tile or []) 
+                    if tile[1][0] < x1 and tile[1][2] > x0 
+                       and tile[1][1] < y1 and tile[1][3] > y0]
+        if len(tiles) > 0 and len(tiles) < len(img.tile) and \
+           not getattr(img, 'use_load_libtiff', False):
+            img.tile = tiles # DECODE ONLY TILES (STRIPS) INSIDE REGION
+        return np.array(img.crop((x0, y0, x1, y1)))
 
 #-----------------------------------
 
-def _imgs2gray(img_pths):
+def _imgs2gray(img_pths, n_jobs = None, journal = None):
     '''Convert Image to gray scale format.
     Parameters
     -----------
     img_pths: list[string],
       list of image pathes 2 check and resize.
+    n_jobs: int,
+      number of processes, os.cpu_count() if None.
+    journal: string,
+      path to completion journal to resume interrupted run.
     
     Returns
     --------
     list[string],
       list of corrected images
+    dict,
+      time of stages, see _transform_images.
     '''    
-    report_list = list()
-    for img_pth in img_pths:
-        img = Image.open(img_pth)
-        if Image.open(img_pth).mode != 'L':
-            img.convert("L").save(img_pth)
-            report_list.append(img_pth)
-    return report_list
+    return _transform_images(img_pths, 'gray', {}, n_jobs, journal)[:2]
 #-----------------------------------
 
 #----------------------------------
 
-def _resize_imgs(img_pths, width, height):
+def _resize_imgs(img_pths, width, height, n_jobs = None, journal = None):
     ''' Resize Image by list of pathes
     Parameters
     -----------
@@ -38,21 +114,20 @@ def _resize_imgs(img_pths, width, height):
       list of image pathes 2 check and resize.
     width, height: int, int,
       image width and height
+    n_jobs: int,
+      number of processes, os.cpu_count() if None.
+    journal: string,
+      path to completion journal to resume interrupted run.
     
     Returns
     --------
     list[string],
       list of corrected images
+    dict,
+      time of stages, see _transform_images.
     '''
-    report_list = list()
-    for img_pth in img_pths:
-        img = Image.open(img_pth)
-        width_, height_ = img.size
-        if width_ != width or height_ != height:
-            img = img.resize((width, height), Image.ANTIALIAS)
-            img.save(img_pth)
-            report_list.append(img_pth)
-    return report_list
+    return _transform_images(img_pths, 'resize', 
+                             {'width': width, 'height': height}, n_jobs, journal)[:2]
 
 #----------------------------------
 
@@ -0,0 +1,90 @@
+import os
+import threading
+from collections import OrderedDict
+
+__all__ = ['ImageCache']
+
+#-----------------------------------
+class ImageCache():
+    '''
+    In-memory LRU cache of decoded images bounded by bytes.
+
+    Atributs
+    ----------
+    max_bytes: int,
+      maximal size of cached arrays, least recently
+      used images are evicted if exceeded.
+    readonly: bool,
+      if True, cached arrays are returned as read-only,
+      so callers can not corrupt cached frames.
+    hits, misses: int,
+      counters of cache usage.
+
+    Notes
+    -------
+    entries are keyed by file path and validated
+      by file modification time and size.
+    '''
+    def __init__(self, max_bytes = 512*2**20, readonly = True):
+        self.max_bytes = int(max_bytes)
+        self.readonly  = readonly
+        self.hits      = 0
+        self.misses    = 0
+        self.nbytes    = 0
+        self.__entries = OrderedDict()
+        self.__lock    = threading.Lock()
+
+    #-----------------------------------
+    def get(self, path, loader):
+        '''
+        Get image from cache or load it.
+
+        Paramters
+        ----------
+        path: string,
+          image path.
+        loader: callable,
+          function path -> ndarray, used if miss.
+
+        Returns
+        ------------
+        ndarray: image.
+        '''
+        stat = os.stat(path)
+        key  = (stat.st_mtime_ns, stat.st_size)
+        with self.__lock:
+            entry = self.__entries.get(path)
+            if entry is not None and entry[0] == key:
+                self.__entries.move_to_end(path)
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+
+        image = loader(path)
+        if self.readonly: image.flags.writeable = False
+        with self.__lock:
+            self.__pop(path)
+            if image.nbytes <= self.max_bytes:
+                self.__entries[path] = (key, image)
+                self.nbytes += image.nbytes
+            while self.nbytes > self.max_bytes:
+                self.__pop(next(iter(self.__entries)))
+        return image
+
+    #-----------------------------------
+    def stats(self):
+        ''' Cache usage: hits, misses, entries, bytes.'''
+        return {'hits': self.hits, 'misses': self.misses,
+                'entries': len(self.__entries), 'bytes': self.nbytes}
+
+    def clear(self):
+        ''' Remove all entries.'''
+        with self.__lock:
+            self.__entries.clear()
+            self.nbytes = 0
+        return self
+
+    #-----------------------------------
+    def __pop(self, path):
+        entry = self.__entries.pop(path, None)
+        if entry is not None: self.nbytes -= entry[1].nbytes
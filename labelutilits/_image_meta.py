@@ -0,0 +1,156 @@
+import os
+from stat import S_ISREG
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from PIL import Image
+
+from ._bmp import _bmp_header
+from ._jsonio import _load, _dump
+
+__all__ = ['_probe_image', '_probe_images', '_clear_probe_cache', '_scan_files',
+           '_load_probe_cache', '_save_probe_cache']
+
+_PROBE_CACHE = dict()
+_PROBE_LOCK  = threading.Lock()
+
+#-----------------------------------
+def _probe_header(img_pth):
+    '''Read image size and mode from file header only (without decoding).
+    Returns
+    --------
+    dict: 'width', 'height', 'mode' (PIL mode).
+    '''
+    if os.path.splitext(img_pth)[1].lower() == '.bmp':
+        header = _bmp_header(img_pth)
+        if header is not None and header['compression'] == 0:
+            palette = header['palette']
+            mode = {24:'RGB', 32:'RGB'}.get(header['bpp'])
+            if header['bpp'] == 8 and len(palette) == 256 and \
+               (palette == np.arange(256, dtype=np.uint8)[:, None]).all():
+                mode = 'L'
+            if mode is not None:
+                return {'width': header['width'], 'height': header['height'], 'mode': mode}
+    with Image.open(img_pth) as img: # PIL READS ONLY HEADER ON OPEN
+        return {'width': img.size[0], 'height': img.size[1], 'mode': img.mode}
+
+#-----------------------------------
+def _probe_image(img_pth, stat = None):
+    '''Image size and mode from file header,
+       cached by (path, modification time, file size).
+    Parameters
+    -----------
+    img_pth: string,
+      image path.
+    stat: os.stat_result; os.DirEntry,
+      file stat or directory entry if already known.
+
+    Returns
+    --------
+    dict: 'width', 'height', 'mode' (PIL mode).
+    '''
+    if stat is None: stat = os.stat(img_pth)
+    if isinstance(stat, os.DirEntry): stat = stat.stat()
+    key = (stat.st_mtime_ns, stat.st_size)
+    with _PROBE_LOCK:
+        entry = _PROBE_CACHE.get(img_pth)
+    if entry is not None and entry[0] == key:
+        return dict(entry[1])
+    meta = _probe_header(img_pth)
+    with _PROBE_LOCK:
+        _PROBE_CACHE[img_pth] = (key, meta)
+    return dict(meta)
+
+#-----------------------------------
+def _probe_images(img_pths, n_threads = 16, stats = None):
+    '''Probe sizes and modes of many images on thread pool.
+    Parameters
+    -----------
+    img_pths: list[string],
+      image paths.
+    n_threads: int,
+      number of threads, probing in current thread if 1.
+    stats: list[os.stat_result; os.DirEntry],
+      file stats or directory entries if already known.
+
+    Returns
+    --------
+    list[dict]: 'width', 'height', 'mode' for each image,
+      None for images which can not be opened.
+    '''
+    if stats is None: stats = [None]*len(img_pths)
+    def probe(args):
+        try:
+            return _probe_image(*args)
+        except (OSError, SyntaxError, ValueError):
+            return None
+    tasks = list(zip(img_pths, stats))
+    if n_threads <= 1 or len(tasks) <= 1:
+        return [probe(task) for task in tasks]
+    with ThreadPoolExecutor(max_workers = n_threads) as pool:
+        return list(pool.map(probe, tasks))
+
+def _clear_probe_cache():
+    ''' Clear cache of image sizes.'''
+    with _PROBE_LOCK:
+        _PROBE_CACHE.clear()
+
+#-----------------------------------
+def _load_probe_cache(path):
+    '''Load sizes cache saved by _save_probe_cache,
+       entries are still validated by modification time and size.'''
+    if path is None or not os.path.isfile(path): return
+    try:
+        entries = _load(path)
+    except ValueError:
+        return # BROKEN CACHE IS IGNORED
+    with _PROBE_LOCK:
+        for img_pth, (mtime_ns, size, meta) in entries.items():
+            _PROBE_CACHE.setdefault(img_pth, ((mtime_ns, size), meta))
+
+def _save_probe_cache(path, img_pths = None):
+    '''Save sizes cache (of img_pths or all) into json file.'''
+    with _PROBE_LOCK:
+        keys    = _PROBE_CACHE.keys() if img_pths is None else img_pths
+        entries = {k:[*_PROBE_CACHE[k][0], _PROBE_CACHE[k][1]] 
+                     for k in keys if k in _PROBE_CACHE}
+    tmp_pth = path + '.part'
+    _dump(entries, tmp_pth)
+    os.replace(tmp_pth, path)
+
+#-----------------------------------
+def _scan_files(img_pths):
+    '''Find files by listing each distinct directory once (os.scandir).
+    Parameters
+    -----------
+    img_pths: list[string],
+      file pathes.
+
+    Returns
+    --------
+    list[os.DirEntry; os.stat_result]: directory entry for each path
+      (file stat for names found only by os.stat), None if file does not exist.
+
+    Notes
+    ------
+    names are matched with listing exactly, missed names are checked
+      by os.stat, so names which differ by case are found on
+      case-insensitive filesystems (Windows, macOS).
+    '''
+    listings = dict()
+    for dir_pth in dict.fromkeys(os.path.dirname(p) for p in img_pths):
+        try:
+            with os.scandir(dir_pth or '.') as it:
+                listings[dir_pth] = {e.name:e for e in it if e.is_file()}
+        except (FileNotFoundError, NotADirectoryError, PermissionError):
+            listings[dir_pth] = dict()
+    entries = [listings[os.path.dirname(p)].get(os.path.basename(p)) for p in img_pths]
+    return [_stat_file(p) if entry is None else entry for p, entry in zip(img_pths, entries)]
+
+def _stat_file(path):
+    ''' Stat of regular file, None if it does not exist.'''
+    try:
+        stat = os.stat(path)
+    except (OSError, ValueError):
+        return None
+    return stat if S_ISREG(stat.st_mode) else None
@@ -0,0 +1,110 @@
+from ._image_transform import (_transform_images,
+                               _plan_steps)
+
+__all__ = ['ImagePipeline']
+
+#-----------------------------------
+class ImagePipeline():
+    '''
+    Chain of image operations applied to each file
+      after one decode and before one encode.
+
+    Atributs
+    ----------
+    steps: list[list[string, dict]],
+      operations in order of application.
+
+    Examples
+    ----------
+    pipeline = ImagePipeline().gray().resize(648, 512).clahe()
+    pipeline.run(img_pths, dry_run = True)
+
+    Notes
+    -------
+    steps which do not change image (gray for gray image,
+      resize to the same size, ...) are skipped by image header,
+      file is not rewritten if no step changes it.
+    '''
+    def __init__(self, steps = None):
+        self.steps = [list(step) for step in steps] if steps is not None else []
+
+    def __repr__(self):
+        return f'ImagePipeline({self.steps})'
+
+    def __len__(self):
+        return len(self.steps)
+
+    #-----------------------------------
+    def gray(self):
+        ''' Convert to gray scale (PIL mode L).'''
+        self.steps.append(['gray', {}])
+        return self
+
+    def resize(self, width, height):
+        ''' Resize to width x height (Lanczos filter).'''
+        self.steps.append(['resize', {'width': int(width), 'height': int(height)}])
+        return self
+
+    def crop(self, x, y, width, height):
+        ''' Crop region (x,y,width,height), clipped by image bounds.'''
+        self.steps.append(['crop', {'x': int(x), 'y': int(y), 
+                                    'width': int(width), 'height': int(height)}])
+        return self
+
+    def pad(self, width, height, fill = 0):
+        ''' Pad right and bottom up to width x height by fill value.'''
+        if not isinstance(fill, (int, float)): fill = list(fill)
+        self.steps.append(['pad', {'width': int(width), 'height': int(height), 'fill': fill}])
+        return self
+
+    def clahe(self, clip_limit = 2.0, tile_size = 8):
+        ''' Contrast limited adaptive histogram equalization (cv2),
+            applied to lightness for color images.'''
+        self.steps.append(['clahe', {'clip_limit': float(clip_limit), 'tile_size': int(tile_size)}])
+        return self
+
+    #-----------------------------------
+    def plan(self, width, height, mode = 'RGB'):
+        '''
+        Effect of pipeline on image by its size and mode.
+
+        Returns
+        ------------
+        changed: bool,
+          True if image would be changed.
+        size: tuple(int,int),
+          output size (width, height).
+        affine: tuple(float,float,float,float),
+          coordinates transform (sx,sy,bx,by): x' = sx*x + bx, y' = sy*y + by.
+        '''
+        changed, size, affine = _plan_steps(self.steps, mode, (width, height))
+        return any(changed), size, affine
+
+    #-----------------------------------
+    def run(self, img_pths, dst_pths = None, n_jobs = None, journal = None, dry_run = False):
+        '''
+        Apply pipeline to images on process pool.
+
+        Paramters
+        ----------
+        img_pths: list[string],
+          image pathes.
+        dst_pths: list[string],
+          destination pathes, transform in place if None.
+        n_jobs: int,
+          number of processes, os.cpu_count() if None,
+          in the current process if 1.
+        journal: string,
+          path to completion journal to resume interrupted run.
+        dry_run: bool,
+          if True, only image headers are read and nothing is written.
+
+        Returns
+        ------------
+        list[string],
+          list of changed (or would be changed if dry_run) images.
+        dict,
+          time of stages, see _transform_images.
+        '''
+        return _transform_images(img_pths, 'pipeline', {'steps': self.steps}, 
+                                 n_jobs, journal, dst_pths, dry_run)[:2]
@@ -0,0 +1,311 @@
+import os
+import shutil
+import time
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import cv2
+from PIL import Image
+
+from ._jsonio import _loads, _dumps
+
+__all__ = ['_transform_image', '_transform_images', '_load_journal', '_manifest_path',
+           '_op_steps', '_plan_steps', '_steps2mask']
+
+MANIFEST_NAME = '.manifest.jsonl'
+
+#-----------------------------------
+# STEPS: [name, params], name in 'gray', 'resize', 'crop', 'pad', 'clahe'
+def _crop_box(params, width, height):
+    ''' Crop box (x0,y0,x1,y1) clipped by image size.'''
+    x0, y0 = params['x'], params['y']
+    x1, y1 = min(max(x0 + params['width'], 0), width), min(max(y0 + params['height'], 0), height)
+    return min(max(x0, 0), x1), min(max(y0, 0), y1), x1, y1
+
+def _plan_step(step, mode, size):
+    '''Effect of step on image with given mode and size (from header).
+    Returns
+    --------
+    mode, size: string, tuple(int,int),
+      output mode and size (width, height).
+    affine: tuple(float,float,float,float),
+      coordinates transform (sx,sy,bx,by): x' = sx*x + bx, y' = sy*y + by.
+    changed: bool,
+      False if step does not change image.
+    '''
+    name, params = step
+    w, h = size
+    if name == 'gray':
+        return 'L', size, (1., 1., 0., 0.), mode != 'L'
+    if name == 'resize':
+        new = (params['width'], params['height'])
+        return mode, new, (new[0]/w, new[1]/h, 0., 0.), new != size
+    if name == 'crop':
+        x0, y0, x1, y1 = _crop_box(params, w, h)
+        return mode, (x1 - x0, y1 - y0), (1., 1., -x0, -y0), (x0, y0, x1, y1) != (0, 0, w, h)
+    if name == 'pad':
+        new = (max(w, params['width']), max(h, params['height']))
+        return mode, new, (1., 1., 0., 0.), new != size
+    if name == 'clahe':
+        return mode, size, (1., 1., 0., 0.), True
+    raise ValueError(f'unknown image operation {name}')
+
+def _plan_steps(steps, mode, size):
+    '''Effect of steps on image with given mode and size (from header).
+    Returns
+    --------
+    changed: list[bool],
+      change flag of each step.
+    size: tuple(int,int),
+      output size (width, height).
+    affine: tuple(float,float,float,float),
+      composite coordinates transform (sx,sy,bx,by).
+    '''
+    sx, sy, bx, by = 1., 1., 0., 0.
+    changed = []
+    for step in steps:
+        mode, size, (a, b, c, d), changed_ = _plan_step(step, mode, size)
+        sx, sy, bx, by = sx*a, sy*b, bx*a + c, by*b + d
+        changed.append(changed_)
+    return changed, size, (sx, sy, bx, by)
+
+def _apply_step(step, img):
+    ''' Apply step to PIL image.'''
+    name, params = step
+    if name == 'gray':
+        return img.convert('L')
+    if name == 'resize':
+        return img.resize((params['width'], params['height']), Image.LANCZOS)
+    if name == 'crop':
+        return img.crop(_crop_box(params, *img.size))
+    if name == 'pad':
+        fill   = tuple(params['fill']) if isinstance(params['fill'], list) else params['fill']
+        canvas = Image.new(img.mode, _plan_step(step, img.mode, img.size)[1], fill)
+        canvas.paste(img, (0, 0))
+        return canvas
+    if name == 'clahe':
+        if img.mode not in ('L', 'RGB'):
+            raise ValueError(f'clahe is not supported for image mode {img.mode}')
+        clahe = cv2.createCLAHE(clipLimit = params['clip_limit'], 
+                                tileGridSize = (params['tile_size'],)*2)
+        arr = np.asarray(img)
+        if arr.ndim == 2: return Image.fromarray(clahe.apply(arr))
+        lab = cv2.cvtColor(arr, cv2.COLOR_RGB2LAB) # EQUALIZE LIGHTNESS ONLY
+        lab[..., 0] = clahe.apply(np.ascontiguousarray(lab[..., 0]))
+        return Image.fromarray(cv2.cvtColor(lab, cv2.COLOR_LAB2RGB))
+    raise ValueError(f'unknown image operation {name}')
+
+def _steps2mask(mask, steps):
+    '''Apply geometric steps (resize, crop, pad) to binary mask,
+       with nearest neighbour interpolation.'''
+    for name, params in steps:
+        h, w = mask.shape[:2]
+        if name == 'resize':
+            mask = cv2.resize(mask, (params['width'], params['height']), 
+                              interpolation = cv2.INTER_NEAREST)
+        elif name == 'crop':
+            x0, y0, x1, y1 = _crop_box(params, w, h)
+            mask = mask[y0:y1, x0:x1]
+        elif name == 'pad':
+            mask = np.pad(mask, ((0, max(params['height'] - h, 0)), 
+                                 (0, max(params['width']  - w, 0))))
+    return np.ascontiguousarray(mask)
+
+def _op_steps(op, params):
+    ''' Steps of operation: 'pipeline' has steps in params,
+        other operations are single steps.'''
+    return params['steps'] if op == 'pipeline' else [[op, params]]
+
+#-----------------------------------
+def _temp_path(img_pth):
+    ''' Path of temporary file for atomic replacement of img_pth.'''
+    head, tail = os.path.split(img_pth)
+    return os.path.join(head, '.' + tail + '.part')
+
+def _save_atomic(img, img_pth, fmt = None):
+    '''Save image (PIL Image or path of file to copy) to temporary 
+       file in the same directory and replace img_pth by it,
+       so img_pth is never half-written.
+    '''
+    tmp_pth = _temp_path(img_pth)
+    try:
+        if isinstance(img, str):
+            shutil.copyfile(img, tmp_pth) # COPY OF UNCHANGED SOURCE
+        else:
+            img.save(tmp_pth, format = fmt)
+        os.replace(tmp_pth, img_pth)
+    finally:
+        if os.path.exists(tmp_pth): os.remove(tmp_pth)
+
+#-----------------------------------
+def _transform_image(task):
+    '''
+    Worker: apply transform to one image, the image is decoded
+      once (only if some step changes it) and encoded once.
+
+    Paramters
+    ----------
+    task: tuple(string, string, string, dict, bool),
+      source image path, destination path (the same
+      for transform in place), operation name ('gray', 'resize',
+      'crop', 'pad', 'clahe' or 'pipeline'), its parameters
+      and dry run flag (only image header is read).
+
+    Returns
+    ------------
+    tuple(string, bool, dict, tuple(int,int), tuple(int,int)): source path, 
+      True if image was (would be) changed, time of stages 'read', 
+      'transform', 'write', source size (width, height) and size
+      of written (planned if dry run) image.
+    '''
+    img_pth, dst_pth, op, params, dry_run = task
+    steps  = _op_steps(op, params)
+    timing = {'read': 0., 'transform': 0., 'write': 0.}
+    t0 = time.perf_counter()
+    with Image.open(img_pth) as img:
+        fmt, size = img.format, img.size
+        changed, out_size = _plan_steps(steps, img.mode, img.size)[:2]
+        out = None
+        if any(changed) and not dry_run:
+            img.load()
+            t1  = time.perf_counter()
+            timing['read'] = t1 - t0
+            out = img
+            for step, changed_ in zip(steps, changed):
+                if changed_: out = _apply_step(step, out)
+            timing['transform'] = time.perf_counter() - t1
+        else:
+            timing['read'] = time.perf_counter() - t0
+    if dry_run or (out is None and dst_pth == img_pth): 
+        return img_pth, any(changed), timing, size, tuple(out_size)
+    t2 = time.perf_counter()
+    os.makedirs(os.path.dirname(os.path.abspath(dst_pth)), exist_ok = True)
+    _save_atomic(img_pth if out is None else out, dst_pth, fmt)
+    timing['write'] = time.perf_counter() - t2
+    return img_pth, out is not None, timing, size, size if out is None else out.size
+
+#-----------------------------------
+def _manifest_path(output_dir):
+    ''' Path of journal (manifest) of transforms written into output_dir.'''
+    return os.path.join(output_dir, MANIFEST_NAME)
+
+def _file_key(img_pth):
+    stat = os.stat(img_pth)
+    return [stat.st_mtime_ns, stat.st_size]
+
+def _load_journal(journal, op, params):
+    '''
+    Read completion journal of transform.
+
+    Paramters
+    ----------
+    journal: string,
+      path to journal file (json lines).
+    op: string,
+      operation name.
+    params: dict,
+      operation parameters.
+
+    Returns
+    ------------
+    dict: image path -> record with 'key' [mtime_ns, size], 'dst',
+      'changed', 'size' and 'out_size' for images completed with 
+      the same operation and parameters.
+    '''
+    done = dict()
+    if journal is None or not os.path.isfile(journal): return done
+    with open(journal) as f:
+        for line in f:
+            try:
+                rec = _loads(line)
+            except ValueError:
+                continue # LINE CUT BY INTERRUPTION
+            if rec.get('op') == op and rec.get('params') == params and 'out_size' in rec:
+                done[rec['path']] = rec
+    return done
+
+#-----------------------------------
+def _transform_images(img_pths, op, params, n_jobs = None, journal = None, 
+                      dst_pths = None, dry_run = False):
+    '''
+    Apply transform to images on process pool.
+
+    Paramters
+    ----------
+    img_pths: list[string],
+      image pathes.
+    op: string,
+      operation name, see _transform_image.
+    params: dict,
+      operation parameters.
+    n_jobs: int,
+      number of processes, os.cpu_count() if None,
+      computation in the current process if 1.
+    journal: string,
+      path to completion journal, images completed in previous
+      (possibly interrupted) runs with the same operation are skipped
+      if they were not modified since; no journal if None.
+    dst_pths: list[string],
+      destination pathes, unchanged images are copied;
+      transform in place if None.
+    dry_run: bool,
+      if True, nothing is written, report_list contains images
+      which would be changed (images completed by journal are skipped).
+
+    Returns
+    ------------
+    report_list: list[string],
+      list of changed images (including ones changed
+      by previous runs recorded in journal).
+    timing: dict,
+      total time of stages 'read', 'transform', 'write'
+      (summed over workers), 'wall' time and
+      number of 'skipped' (resumed) images.
+    sizes: list[tuple(int,int)],
+      source size (width, height) of each image.
+    out_sizes: list[tuple(int,int)],
+      size of written (planned if dry_run) image, taken from
+      workers and journal, output files are not read again.
+    '''
+    if n_jobs is None: n_jobs = os.cpu_count() or 1
+    if dst_pths is None: dst_pths = img_pths
+    if journal is not None and not dry_run:
+        os.makedirs(os.path.dirname(os.path.abspath(journal)), exist_ok = True)
+    start = time.perf_counter()
+    done  = _load_journal(journal, op, params)
+
+    results_, tasks = dict(), []
+    for img_pth, dst_pth in dict(zip(img_pths, dst_pths)).items():
+        rec = done.get(img_pth)
+        if rec is not None and rec.get('dst', img_pth) == dst_pth and os.path.isfile(dst_pth) \
+           and os.path.isfile(img_pth) and rec['key'] == _file_key(img_pth):
+            results_[img_pth] = (rec['changed'] and not dry_run, tuple(rec['size']), 
+                                 tuple(rec['out_size']))
+        else:
+            tasks.append((img_pth, dst_pth, op, params, dry_run))
+
+    timing = {'read': 0., 'transform': 0., 'write': 0., 'skipped': len(results_)}
+    pool = ProcessPoolExecutor(max_workers = n_jobs) if n_jobs > 1 and len(tasks) > 1 else None
+    log  = open(journal, 'a') if journal is not None and not dry_run else None
+    try:
+        if pool is None:
+            results = map(_transform_image, tasks)
+        else:
+            results = pool.map(_transform_image, tasks,
+                               chunksize = max(1, len(tasks)//(4*n_jobs)))
+        for (img_pth, changed, timing_, size, out_size), task in zip(results, tasks):
+            results_[img_pth] = (changed, size, out_size)
+            for stage, value in timing_.items(): timing[stage] += value
+            if log is not None:
+                log.write(_dumps({'op': op, 'params': params, 'path': img_pth,
+                                      'dst': task[1], 'key': _file_key(img_pth), 
+                                      'changed': changed, 'size': list(size),
+                                      'out_size': list(out_size)}) + '\n')
+                log.flush()
+    finally:
+        if pool is not None: pool.shutdown()
+        if log  is not None: log.close()
+
+    timing['wall'] = time.perf_counter() - start
+    report_list = [img_pth for img_pth in dict.fromkeys(img_pths) if results_[img_pth][0]]
+    return (report_list, timing, [results_[img_pth][1] for img_pth in img_pths],
+            [results_[img_pth][2] for img_pth in img_pths])
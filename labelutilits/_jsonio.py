@@ -0,0 +1,70 @@
+import json
+
+try:
+    import orjson # OPTIONAL FAST BACKEND
+except ImportError:
+    orjson = None
+
+__all__ = ['_load', '_loads', '_dump', '_dumps', 'JSON_BACKEND']
+
+JSON_BACKEND = 'json' if orjson is None else 'orjson'
+SEPARATORS   = (',', ':')
+
+# DIGITS -> b'1', OTHER BYTES -> b'0'
+_DIGITS      = bytes(0x31 if 0x30 <= i <= 0x39 else 0x30 for i in range(256))
+_LONG_NUMBER = b'1'*19 # INTEGERS BEYOND 64 BITS ARE DECODED BY ORJSON AS FLOATS
+
+#-----------------------------------
+def _loads(text):
+    '''
+    Decode JSON text (string or bytes) by orjson if it is installed,
+      by stdlib json otherwise.
+
+    Notes
+    ------
+    text rejected by orjson (NaN, Infinity, not UTF-8 bytes) and 
+      text with numbers of 19 or more digits (integers beyond 
+      64 bits are decoded by orjson as floats) is decoded by 
+      stdlib json, so result and errors are the same for both backends.
+    '''
+    if orjson is not None:
+        raw = text.encode('utf-8', 'surrogatepass') if isinstance(text, str) else text
+        if raw.translate(_DIGITS).find(_LONG_NUMBER) < 0:
+            try:
+                return orjson.loads(raw)
+            except orjson.JSONDecodeError:
+                pass
+    return json.loads(text)
+
+def _load(path):
+    ''' Decode JSON file, see _loads.'''
+    with open(path, 'rb') as f:
+        return _loads(f.read())
+
+#-----------------------------------
+def _dumps(obj):
+    '''
+    Encode object to compact JSON string (separators ',' and ':')
+      by orjson if it is installed, by stdlib json otherwise.
+
+    Notes
+    ------
+    output is decoded to the same values by both backends;
+      objects which orjson encodes differently from stdlib
+      (non-ASCII text, NaN and Infinity written as null) or
+      does not encode (numpy scalars, integers beyond 64 bits)
+      are encoded by stdlib json.
+    '''
+    if orjson is not None:
+        try:
+            text = orjson.dumps(obj, option = orjson.OPT_NON_STR_KEYS)
+            if text.isascii() and b'null' not in text:
+                return text.decode()
+        except TypeError:
+            pass
+    return json.dumps(obj, separators = SEPARATORS)
+
+def _dump(obj, path):
+    ''' Encode object to JSON file, see _dumps.'''
+    with open(path, 'w') as f:
+        f.write(_dumps(obj))
@@ -0,0 +1,110 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+
+from ._coco_base import (_segm2crop,
+                         _segm2rle,
+                         _sparse2mode)
+from ._vertex_store import _resolve_segm
+
+__all__ = ['_masks_task', '_cached_masks_task', '_iter_chunks', '_iter_masks']
+
+#-----------------------------------
+def _masks_task(task):
+    '''
+    Worker: masks for one image.
+
+    Paramters
+    ----------
+    task: tuple(list, int, int, string, string),
+      segmentations of instances (polygons, RLE or references
+      to polygons in vertex store, see _vertex_store._polygon_ref), 
+      image height, image width, mode and order (see Annotation.get_masks).
+
+    Returns
+    ------------
+    ndarray: masks in required mode.
+    '''
+    segms, h, w, mode, order = task
+    crops, offsets = [], []
+    for segm in segms:
+        crop, offset = _segm2crop(_resolve_segm(segm), h, w)
+        crops.append(crop); offsets.append(offset)
+    return _sparse2mode(crops, offsets, (h, w), mode, order)
+
+def _cached_masks_task(task):
+    '''
+    Worker: masks for one image with mask cache, instances 
+      missed in cache are rasterized into RLE here.
+
+    Paramters
+    ----------
+    task: tuple(list, int, int, string, string, list[int]),
+      segmentations of instances (RLE from cache, polygons or 
+      references to polygons in vertex store), image height, 
+      image width, mode, order and positions of missed instances.
+
+    Returns
+    ------------
+    ndarray: masks in required mode.
+    list[dict]: RLE of missed instances, to put into cache.
+    '''
+    segms, h, w, mode, order, missed = task
+    segms = list(segms)
+    for i in missed:
+        segms[i] = _segm2rle(_resolve_segm(segms[i]), h, w)
+    return _masks_task((segms, h, w, mode, order)), [segms[i] for i in missed]
+
+#-----------------------------------
+def _iter_chunks(iterable, size):
+    ''' Split iterable into lists of length size.'''
+    iterable = iter(iterable)
+    while True:
+        chunk = list(islice(iterable, size))
+        if not chunk: return
+        yield chunk
+
+#-----------------------------------
+def _iter_masks(tasks, n_jobs = None, chunk_size = 8, worker = _masks_task):
+    '''
+    Compute masks for many images, results are streamed
+      in the order of tasks by chunks of chunk_size.
+
+    Paramters
+    ----------
+    tasks: iterable[tuple],
+      tasks for worker, taken lazily chunk by chunk.
+    n_jobs: int,
+      number of processes, os.cpu_count() if None,
+      computation in the current process if 1.
+    chunk_size: int,
+      number of images in chunk.
+    worker: function,
+      _masks_task or _cached_masks_task.
+
+    Returns
+    ------------
+    generator[list]: results of worker for chunks of tasks.
+
+    Note
+    -----
+    at most two chunks (the returned one and the one
+      being computed) are kept in memory.
+    '''
+    if n_jobs is None: n_jobs = os.cpu_count() or 1
+    chunks = _iter_chunks(tasks, max(int(chunk_size), 1))
+
+    if n_jobs <= 1:
+        for chunk in chunks:
+            yield [worker(task) for task in chunk]
+        return
+
+    with ProcessPoolExecutor(max_workers = n_jobs) as pool:
+        pending = None
+        for chunk in chunks:
+            futures = [pool.submit(worker, task) for task in chunk]
+            if pending is not None:
+                yield [f.result() for f in pending]
+            pending = futures
+        if pending is not None:
+            yield [f.result() for f in pending]
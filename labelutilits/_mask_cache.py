@@ -0,0 +1,233 @@
+import os
+import time
+import hashlib
+import sqlite3
+
+__all__ = ['MaskCache', '_segm_hash']
+
+MAX_VARIABLES = 500 # IMAGE IDS IN ONE QUERY (SQLITE LIMIT OF VARIABLES)
+
+#-----------------------------------
+def _segm_hash(segm, h, w):
+    '''
+    Hash of instance segmentation content and image size.
+
+    Paramters
+    ----------
+    segm: list[ndarray]; dict,
+      polygons (as float arrays) or RLE.
+    h,w: int, int,
+      image height and width.
+
+    Returns
+    ------------
+    string: hex digest.
+    '''
+    digest = hashlib.blake2b(digest_size = 16)
+    digest.update(f'{int(h)}x{int(w)};'.encode())
+    if isinstance(segm, dict):
+        digest.update(repr(sorted(segm.items())).encode())
+    else:
+        for poly in segm:
+            digest.update(memoryview(poly).tobytes() if hasattr(poly, 'dtype')
+                              else repr(list(poly)).encode())
+            digest.update(b';')
+    return digest.hexdigest()
+
+#-----------------------------------
+class MaskCache():
+    '''
+    Persistent cache of instance masks in compressed RLE format,
+      stored in the single sqlite file.
+
+    Atributs
+    ----------
+    path: string,
+      path to cache file.
+    max_bytes: int,
+      maximal size of stored RLE, least recently used
+      entries are evicted if exceeded.
+    hits, misses: int,
+      counters of cache usage.
+
+    Notes
+    -------
+    entries are keyed by (image_id, annotation id, hash),
+      where hash is computed from polygons and image size,
+      so entries become invalid if any of them changes.
+    '''
+    def __init__(self, path, max_bytes = 256*2**20):
+        if os.path.isdir(path):
+            path = os.path.join(path, 'mask_cache.sqlite')
+        self.path      = path
+        self.max_bytes = int(max_bytes)
+        self.hits      = 0
+        self.misses    = 0
+        self.__db = sqlite3.connect(self.path)
+        # TOTALS ARE KEPT BY TRIGGERS (ALSO FOR ROWS REPLACED BY INSERT OR REPLACE),
+        # SO EVICTION DOES NOT SCAN THE TABLE
+        self.__db.execute('PRAGMA recursive_triggers = ON')
+        self.__db.executescript('''
+            CREATE TABLE IF NOT EXISTS masks (
+                image_id INTEGER, anno_id INTEGER, hash TEXT,
+                h INTEGER, w INTEGER, counts BLOB,
+                nbytes INTEGER, atime REAL,
+                PRIMARY KEY (image_id, anno_id));
+            CREATE INDEX IF NOT EXISTS masks_atime ON masks (atime);
+            CREATE TABLE IF NOT EXISTS totals (
+                key INTEGER PRIMARY KEY CHECK (key = 0),
+                entries INTEGER, nbytes INTEGER);
+            INSERT OR IGNORE INTO totals
+                SELECT 0, COUNT(*), COALESCE(SUM(nbytes), 0) FROM masks;
+            CREATE TRIGGER IF NOT EXISTS masks_insert AFTER INSERT ON masks BEGIN
+                UPDATE totals SET entries = entries + 1, nbytes = nbytes + NEW.nbytes;
+            END;
+            CREATE TRIGGER IF NOT EXISTS masks_delete AFTER DELETE ON masks BEGIN
+                UPDATE totals SET entries = entries - 1, nbytes = nbytes - OLD.nbytes;
+            END;''')
+        self.__evict()
+        self.__db.commit()
+
+    #-----------------------------------
+    def get(self, image_id, anno_ids, hashes):
+        '''
+        Get RLE of instances from cache.
+
+        Paramters
+        ----------
+        image_id: int,
+          image id.
+        anno_ids: list[int],
+          annotation ids.
+        hashes: list[string],
+          hashes of segmentations, see _segm_hash.
+
+        Returns
+        ------------
+        list[dict]: RLE for each annotation, None if miss.
+        '''
+        return self.get_many([(image_id, anno_id, hash_) 
+                                for anno_id, hash_ in zip(anno_ids, hashes)])
+
+    def get_many(self, keys):
+        '''
+        Get RLE of instances of many images by one query.
+
+        Paramters
+        ----------
+        keys: list[tuple(int, int, string)],
+          image id, annotation id and hash of segmentation.
+
+        Returns
+        ------------
+        list[dict]: RLE for each key, None if miss.
+        '''
+        keys = [(int(image_id), int(anno_id), hash_) for image_id, anno_id, hash_ in keys]
+        rows = dict()
+        image_ids = sorted({key[0] for key in keys})
+        for start in range(0, len(image_ids), MAX_VARIABLES):
+            part = image_ids[start:start + MAX_VARIABLES]
+            for image_id, anno_id, hash_, h, w, counts in self.__db.execute(
+                    'SELECT image_id, anno_id, hash, h, w, counts FROM masks '
+                    f'WHERE image_id IN ({",".join("?"*len(part))})', part):
+                rows[(image_id, anno_id, hash_)] = (h, w, counts)
+        out, hit_keys = [], []
+        for key in keys:
+            row = rows.get(key)
+            if row is None:
+                out.append(None)
+                continue
+            h, w, counts = row
+            out.append({'size': [h, w], 'counts': bytes(counts)})
+            hit_keys.append(key[:2])
+        self.hits   += len(hit_keys)
+        self.misses += len(out) - len(hit_keys)
+        if hit_keys:
+            now = time.time()
+            self.__db.executemany('UPDATE masks SET atime = ? WHERE image_id = ? AND anno_id = ?',
+                                  [(now, image_id, anno_id) for image_id, anno_id in hit_keys])
+            self.__db.commit()
+        return out
+
+    #-----------------------------------
+    def put(self, image_id, anno_ids, hashes, rles):
+        '''
+        Put RLE of instances into cache (old entries
+          of the same annotations are replaced).
+
+        Paramters
+        ----------
+        image_id: int,
+          image id.
+        anno_ids: list[int],
+          annotation ids.
+        hashes: list[string],
+          hashes of segmentations, see _segm_hash.
+        rles: list[dict],
+          compressed RLE of instances.
+        '''
+        return self.put_many([(image_id, anno_id, hash_) 
+                                for anno_id, hash_ in zip(anno_ids, hashes)], rles)
+
+    def put_many(self, keys, rles):
+        '''
+        Put RLE of instances of many images by one transaction.
+
+        Paramters
+        ----------
+        keys: list[tuple(int, int, string)],
+          image id, annotation id and hash of segmentation.
+        rles: list[dict],
+          compressed RLE of instances.
+        '''
+        now  = time.time()
+        rows = []
+        for (image_id, anno_id, hash_), rle in zip(keys, rles):
+            counts = rle['counts']
+            if isinstance(counts, str): counts = counts.encode()
+            h, w = rle['size']
+            rows.append((int(image_id), int(anno_id), hash_, int(h), int(w),
+                         sqlite3.Binary(counts), len(counts), now))
+        if not rows: return self
+        self.__db.executemany('INSERT OR REPLACE INTO masks VALUES (?,?,?,?,?,?,?,?)', rows)
+        self.__evict()
+        self.__db.commit()
+        return self
+
+    #-----------------------------------
+    def stats(self):
+        ''' Cache usage: hits, misses, entries, bytes.'''
+        entries, nbytes = self.__totals()
+        return {'hits': self.hits, 'misses': self.misses,
+                'entries': entries, 'bytes': nbytes,
+                'path': self.path}
+
+    #-----------------------------------
+    def clear(self):
+        ''' Remove all entries.'''
+        self.__db.execute('DELETE FROM masks')
+        self.__db.commit()
+        return self
+
+    def close(self):
+        ''' Close cache file.'''
+        self.__db.close()
+
+    #-----------------------------------
+    def __totals(self):
+        ''' Number of entries and size of stored RLE.'''
+        entries, nbytes = self.__db.execute('SELECT entries, nbytes FROM totals').fetchone()
+        return int(entries), int(nbytes)
+
+    def __evict(self):
+        ''' Remove least recently used entries over max_bytes,
+            oldest entries are read by index of access time.'''
+        total = self.__totals()[1]
+        if total <= self.max_bytes: return
+        drop = []
+        for image_id, anno_id, nbytes in self.__db.execute(
+                'SELECT image_id, anno_id, nbytes FROM masks ORDER BY atime ASC'):
+            if total <= self.max_bytes: break
+            drop.append((image_id, anno_id))
+            total -= nbytes
+        self.__db.executemany('DELETE FROM masks WHERE image_id = ? AND anno_id = ?', drop)
@@ -4,7 +4,28 @@ import json
 from PIL import Image
 import pandas as pd
 
-from ._annotation_base import (_data2df,_data_head, _df2anno)
+from ._image_meta import (_probe_images,
+                          _scan_files,
+                          _load_probe_cache,
+                          _save_probe_cache)
+from ._anno_index import _group_positions
+from ._anno_columns import _take_columns
+
+HEAD_KEYS = ('licenses', 'info', 'categories')
+
+#---------------------------------------
+def _reset_image_list(images, labeled_ids):
+    '''Images with annotations sorted by id,
+       for duplicated file names the first image is kept.'''
+    labeled_ids = set(labeled_ids)
+    images = sorted((x for x in images if x['id'] in labeled_ids), key = lambda x: x['id'])
+    fnames = set()
+    out = []
+    for x in images:
+        if x['file_name'] in fnames: continue
+        fnames.add(x['file_name'])
+        out.append(x)
+    return out
 
 #---------------------------------------
 def _reset_indexes(data):
@@ -20,16 +41,41 @@ def _reset_indexes(data):
     ----------
     data: dict[list[dict]], 
       coco format dict from json.
+
+    Notes
+    ------
+    annotations are sorted by image id (stable) and
+      renumbered from 1, images without annotations are removed.
     '''
-    anno_df = _data2df(data)
-    anno_df =  anno_df.sort_values(by=['image_id'])
-    anno_df['id'] = (np.arange(len(anno_df)).astype(int)+1)
-    data_head, anno_keys, img_keys = _data_head(data)
-    data = _df2anno(anno_df, data_head, anno_keys, img_keys)
-    return data
+    annotations = data['annotations']
+    image_ids = np.fromiter((x['image_id'] for x in annotations), 
+                            dtype=np.int64, count=len(annotations))
+    order = np.argsort(image_ids, kind='stable')
+    out = {k:v for k,v in data.items() if k in HEAD_KEYS}
+    out['annotations'] = [{**annotations[i], 'id':anno_id} 
+                             for anno_id, i in enumerate(order.tolist(), 1)]
+    out['images'] = _reset_image_list(data['images'], image_ids.tolist())
+    return out
+
+def _reset_columns_indexes(data, columns):
+    '''Reset indexes for data with annotations in columns store,
+       see _reset_indexes.
+
+    Returns
+    ----------
+    data: dict[list[dict]], 
+      coco format dict without annotations.
+    columns: dict[string:ndarray],
+      columns store, see _anno_columns._ColumnsBuilder.
+    '''
+    columns = _take_columns(columns, np.argsort(columns['image_id'], kind='stable'))
+    columns['id'] = np.arange(1, len(columns['id']) + 1, dtype=np.int32)
+    out = {k:v for k,v in data.items() if k in HEAD_KEYS}
+    out['images'] = _reset_image_list(data['images'], np.unique(columns['image_id']).tolist())
+    return out, columns
 
 #---------------------------------------
-def _reset_images(data):
+def _reset_images(data, entries = None):
     '''
     Reset images in COCO JSON annotations,
       relative to existed in image directory.
@@ -38,6 +84,9 @@ def _reset_images(data):
     ---------
     data: dict[list[dict]],
       data annotation dictionary in JSON COCO format.
+    entries: list[os.DirEntry],
+      directory entries of images (see _scan_files),
+      each image directory is listed once if None.
     
     Returns
     ----------
@@ -46,13 +95,14 @@ def _reset_images(data):
     DataFrame: report with removed file_names and ids. 
     
     '''
+    if entries is None: entries = _scan_files([x['file_name'] for x in data['images']])
     report = [[x['id'], x['file_name']] 
-                 for x in data['images'] 
-                    if not os.path.exists(x['file_name'])]
+                 for x, entry in zip(data['images'], entries)
+                    if entry is None]
     
   
-    data['images'] = [x for x in data['images'] 
-                         if os.path.exists(x['file_name'])]
+    data['images'] = [x for x, entry in zip(data['images'], entries) 
+                         if entry is not None]
     
     
     return data, pd.DataFrame(report, 
@@ -76,55 +126,74 @@ def _reset_labels(data):
       dictionary in JSON COCO format.
     DataFrame: report with removed image ids and anno-ids.    
     '''
-    images_ids = [x['id'] for x in data['images']]
-
-    report = [[x['image_id'],[x['id']]]  for x in data['annotations'] 
-                 if x['image_id'] not in images_ids]
-
-    report = pd.DataFrame(report, 
-                          columns=['delated_img_idx', 
-                                   'delete_id']).\
-                            groupby('delated_img_idx', 
-                                    as_index=False).sum()
-    
-    
+    images_ids = set(x['id'] for x in data['images'])
+    deleted = [x for x in data['annotations'] if x['image_id'] not in images_ids]
     data['annotations'] = [x for x in data['annotations'] 
                               if x['image_id'] in images_ids]
+    return data, _deleted_labels_report([x['image_id'] for x in deleted],
+                                        [x['id'] for x in deleted])
 
-   
-    return data, report
+def _reset_columns_labels(data, columns):
+    '''Remove annotations of unexisted images from columns store,
+       see _reset_labels.
+
+    Returns
+    ----------
+    columns: dict[string:ndarray],
+      columns store, see _anno_columns._ColumnsBuilder.
+    DataFrame: report with removed image ids and anno-ids.    
+    '''
+    images_ids = np.fromiter((x['id'] for x in data['images']), 
+                             dtype=np.int64, count=len(data['images']))
+    keep = np.isin(columns['image_id'], images_ids)
+    report = _deleted_labels_report(columns['image_id'][~keep], columns['id'][~keep])
+    return _take_columns(columns, keep), report
+
+def _deleted_labels_report(image_ids, anno_ids):
+    '''Report of deleted annotations: 
+       list of annotation ids for each image id.'''
+    anno_ids = np.asarray(anno_ids, dtype=np.int64)
+    return pd.DataFrame([[image_id, anno_ids[pos].tolist()] 
+                            for image_id, pos in _group_positions(image_ids).items()],
+                        columns=['delated_img_idx', 'delete_id'])
 
 #---------------------------------------
-def _reset_image_sizes(data):
+def _reset_image_sizes(data, n_threads = 16, stats = None, probe_cache = None):
     '''Correct Image Size in data anno in COCO JSON format.
     Paramters
     -----------
     data: dict[list[dict]],
       annotation dictionary.
+    n_threads: int,
+      number of threads to probe image headers.
+    stats: list[os.stat_result; os.DirEntry],
+      file stats (directory entries) of images if already known.
+    probe_cache: string,
+      path to json file with sizes from previous runs,
+      only images modified since are probed; the file is updated.
     
     Returns
     --------
     data: dict[list[dict]],
       annotation dictionary.
+
+    Notes
+    ------
+    only image headers are read, sizes are cached
+      by file path, modification time and size.
     '''
-#     report = pd.DataFrame(columns = ['old_size', 'new_size'])
-    for i in range(len(data['images'])):
-        fname = data['images'][i]['file_name'] 
-        report_={'fname': data['images'][i]['file_name'],
-                 'old_size':(data['images'][i]['width'], 
-                             data['images'][i]['height'])}
-
-        width, height = Image.open(fname).size
-        data['images'][i]['width']  = width
-        data['images'][i]['height'] = height
-        
-#         report_.update({'new_size':(width, height)})
-#         report = report.append(report_, ignore_index=True)
-
-    return data#, report
+    fnames = [x['file_name'] for x in data['images']]
+    if probe_cache is not None: _load_probe_cache(probe_cache)
+    for img_desc, meta in zip(data['images'], _probe_images(fnames, n_threads, stats)):
+        if meta is None: continue
+        img_desc['width']  = meta['width']
+        img_desc['height'] = meta['height']
+    if probe_cache is not None: _save_probe_cache(probe_cache, fnames)
+
+    return data
 
 #---------------------------------------
-def reset_annotation(data):
+def reset_annotation(data, n_threads = 16, probe_cache = None):
     '''
      Reset annotation in COCO JSON annotations,
       relative to existed in image directory,
@@ -134,6 +203,11 @@ def reset_annotation(data):
     ---------
     data: dict[list[dict]],
       data annotation dictionary in JSON COCO format.
+    n_threads: int,
+      number of threads to probe image sizes.
+    probe_cache: string,
+      path to json file with image sizes from previous runs, 
+      only images modified since are probed; not used if None.
     
     Returns
     ----------
@@ -141,12 +215,56 @@ def reset_annotation(data):
       dictionary in JSON COCO format.
     
     DataFrame: report with removed image ids and anno-ids.    
+
+    Notes
+    ------
+    each image directory is listed once (os.scandir),
+      image sizes are read from headers on thread pool.
     '''
-    data, report_ = _reset_images(data)
+    entries = _scan_files([x['file_name'] for x in data['images']])
+    data, report_ = _reset_images(data, entries)
     data, report = _reset_labels(data)
 
-    data = _reset_image_sizes(data)
+    stats = [entry for entry in entries if entry is not None] # STAT IN PROBE THREADS
+    data = _reset_image_sizes(data, n_threads, stats, probe_cache)
     data = _reset_indexes(data)  
 
     report = pd.merge(report_,report, on="delated_img_idx") 
-    return data, report
\ No newline at end of file
+    return data, report
+
+#---------------------------------------
+def _reset_columns(data, columns, n_threads = 16, probe_cache = None):
+    '''
+     Reset annotation with annotations in columns store,
+      see reset_annotation; all steps are linear 
+      in the number of annotations (array operations).
+
+    Paramters
+    ---------
+    data: dict[list[dict]],
+      data annotation dictionary in JSON COCO format
+      without annotations.
+    columns: dict[string:ndarray],
+      columns store, see _anno_columns._ColumnsBuilder.
+    n_threads: int,
+      number of threads to probe image sizes.
+    probe_cache: string,
+      path to json file with image sizes from previous runs.
+    
+    Returns
+    ----------
+    dict[list[dict]]: data annotation dictionary 
+      in JSON COCO format without annotations.
+    dict[string:ndarray]: columns store.
+    DataFrame: report with removed image ids and anno-ids.    
+    '''
+    entries = _scan_files([x['file_name'] for x in data['images']])
+    data, report_ = _reset_images(dict(data), entries)
+    columns, report = _reset_columns_labels(data, columns)
+
+    stats = [entry for entry in entries if entry is not None] # STAT IN PROBE THREADS
+    data = _reset_image_sizes(data, n_threads, stats, probe_cache)
+    data, columns = _reset_columns_indexes(data, columns)
+
+    report = pd.merge(report_,report, on="delated_img_idx") 
+    return data, columns, report
@@ -0,0 +1,138 @@
+import numpy as np
+from pycocotools import mask as cocoutils
+
+from ._coco_base import _segm2rle
+
+__all__ = ['segm2rle', 'rle_area', 'rle_bbox', 'rle_union', 'rle_intersection',
+           'rle_coverage', 'rle_iou']
+
+#-----------------------------------
+def segm2rle(segm, h, w):
+    '''
+    transform segmentation (polygons or RLE) into compressed RLE
+      compatible with pycocotools, without dense decoding.
+
+    Paramters
+    ----------
+    segm: list[list[float]]; dict,
+      polygons in format [[x,y,x,y...]] or RLE.
+    h,w: int, int,
+      image height and width.
+
+    Returns
+    ------------
+    dict: RLE with keys 'size' and 'counts'.
+    '''
+    return _segm2rle(segm, h, w)
+
+#-----------------------------------
+def rle_area(rles):
+    '''
+    areas (number of object pixels) of RLE masks.
+
+    Paramters
+    ----------
+    rles: dict; list[dict],
+      RLE masks.
+
+    Returns
+    ------------
+    ndarray[int]: area for each mask, int for single RLE.
+    '''
+    if isinstance(rles, dict): return int(cocoutils.area(rles))
+    if len(rles) == 0: return np.zeros(0, dtype = np.int64)
+    return np.asarray(cocoutils.area(list(rles)), dtype = np.int64)
+
+def rle_bbox(rles):
+    '''
+    bounding boxes [x0,y0,w,h] of RLE masks.
+
+    Paramters
+    ----------
+    rles: dict; list[dict],
+      RLE masks.
+
+    Returns
+    ------------
+    ndarray[float]: N x 4 boxes, 4 values for single RLE.
+    '''
+    if isinstance(rles, dict): return np.asarray(cocoutils.toBbox(rles), dtype = np.float64)
+    if len(rles) == 0: return np.zeros((0, 4), dtype = np.float64)
+    return np.asarray(cocoutils.toBbox(list(rles)), dtype = np.float64).reshape(-1, 4)
+
+#-----------------------------------
+def rle_union(rles):
+    '''
+    union of RLE masks of the same size.
+
+    Paramters
+    ----------
+    rles: list[dict],
+      RLE masks.
+
+    Returns
+    ------------
+    dict: RLE of union.
+    '''
+    return cocoutils.merge(list(rles), intersect = 0)
+
+#-----------------------------------
+def rle_intersection(rles):
+    '''
+    intersection of RLE masks of the same size.
+
+    Paramters
+    ----------
+    rles: list[dict],
+      RLE masks.
+
+    Returns
+    ------------
+    dict: RLE of intersection.
+    '''
+    return cocoutils.merge(list(rles), intersect = 1)
+
+#-----------------------------------
+def rle_coverage(rles, h = None, w = None):
+    '''
+    fraction of the image covered by union of RLE masks.
+
+    Paramters
+    ----------
+    rles: list[dict],
+      RLE masks of the same image.
+    h,w: int, int,
+      image height and width, taken from rles if None.
+
+    Returns
+    ------------
+    float: covered area / image area.
+    '''
+    rles = list(rles)
+    if h is None or w is None:
+        if not rles: return 0.
+        h, w = rles[0]['size']
+    if not rles or h*w == 0: return 0.
+    return rle_area(rle_union(rles)) / float(h*w)
+
+#-----------------------------------
+def rle_iou(rles_a, rles_b = None):
+    '''
+    pairwise intersection over union of RLE masks.
+
+    Paramters
+    ----------
+    rles_a: list[dict],
+      RLE masks (N).
+    rles_b: list[dict],
+      RLE masks (M), rles_a if None.
+
+    Returns
+    ------------
+    ndarray: N x M matrix of IoU.
+    '''
+    rles_a = list(rles_a)
+    rles_b = rles_a if rles_b is None else list(rles_b)
+    if not rles_a or not rles_b:
+        return np.zeros((len(rles_a), len(rles_b)))
+    return np.asarray(cocoutils.iou(rles_a, rles_b, [0]*len(rles_b)))
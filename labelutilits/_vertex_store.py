@@ -0,0 +1,129 @@
+import os
+import hashlib
+import threading
+import numpy as np
+
+from ._anno_columns import _float32_exact
+
+__all__ = ['_map_vertex_store', '_vertex_store_path', '_is_mapped',
+           '_open_vertices', '_polygon_ref', '_resolve_segm']
+
+STORE_KEYS   = ('vertices', 'poly_offsets', 'anno_offsets')
+
+_VERTICES      = dict() # PATH -> (FILE KEY, MEMMAP), OPENED IN THIS PROCESS
+_VERTICES_LOCK = threading.Lock()
+
+#-----------------------------------
+def _vertex_store_path(path, key, digest):
+    ''' Path of store file (.npy) of columns key, named by digest of content.'''
+    return os.path.join(path, f'{key}-{digest}.npy')
+
+def _columns_digest(columns):
+    ''' Digest (blake2b) of polygon buffers of columns store.'''
+    digest = hashlib.blake2b(digest_size = 16)
+    for key in STORE_KEYS:
+        arr = np.ascontiguousarray(columns[key])
+        digest.update(f'{key}:{arr.dtype.str}:{arr.shape};'.encode())
+        digest.update(memoryview(arr).cast('B'))
+    return digest.hexdigest()
+
+def _mapped_digest(columns, path):
+    ''' Digest of store files in path the polygon buffers 
+        of columns store are mapped from, None if not mapped.'''
+    if path is None: return None
+    filename = getattr(columns['vertices'], 'filename', None)
+    if filename is None: return None
+    name = os.path.basename(filename)
+    if not (name.startswith('vertices-') and name.endswith('.npy')): return None
+    digest = name[len('vertices-'):-len('.npy')]
+    if all(getattr(columns[key], 'filename', None) ==
+           os.path.abspath(_vertex_store_path(path, key, digest)) for key in STORE_KEYS):
+        return digest
+    return None
+
+def _is_mapped(columns, path):
+    ''' True if polygon buffers of columns store are mapped from store in path.'''
+    return _mapped_digest(columns, path) is not None
+
+#-----------------------------------
+def _save_vertex_store(path, columns, digest):
+    ''' Write polygon buffers into .npy files named by digest
+        through temporary files and atomic rename, existing
+        files are kept (the same name is the same content).'''
+    os.makedirs(path, exist_ok = True)
+    for key in STORE_KEYS:
+        dst_pth = _vertex_store_path(path, key, digest)
+        if os.path.isfile(dst_pth): continue
+        tmp_pth = f'{dst_pth}.{os.getpid()}.part'
+        try:
+            with open(tmp_pth, 'wb') as f:
+                np.save(f, np.ascontiguousarray(columns[key]))
+            os.replace(tmp_pth, dst_pth)
+        finally:
+            if os.path.exists(tmp_pth): os.remove(tmp_pth)
+
+def _map_vertex_store(path, columns):
+    '''
+    Move polygon buffers ('vertices', 'poly_offsets', 'anno_offsets')
+      of columns store into memory-mapped files in directory path.
+
+    Paramters
+    ----------
+    path: string,
+      directory of store.
+    columns: dict[string:ndarray],
+      columns store, see _anno_columns._ColumnsBuilder.
+
+    Returns
+    ------------
+    dict[string:ndarray]: new columns store with read-only
+      np.memmap buffers (other columns are shared).
+
+    Notes
+    ------
+    files are named by digest of content ('vertices-<digest>.npy', ...)
+      and written only if missed, so a mapped file is never replaced:
+      stores with other content (e.g. filtered copy) may share 
+      directory, and processes opening the same dataset map 
+      the same files and share pages through OS cache.
+    files of stores no longer used are not removed.
+    '''
+    if _is_mapped(columns, path): return dict(columns)
+    digest = _columns_digest(columns)
+    _save_vertex_store(path, columns, digest)
+    out = dict(columns)
+    for key in STORE_KEYS:
+        out[key] = np.load(_vertex_store_path(path, key, digest), mmap_mode = 'r')
+    return out
+
+#-----------------------------------
+def _open_vertices(vert_pth):
+    ''' Read-only memmap of vertices file, opened once per process
+        (reopened if file was changed).'''
+    stat = os.stat(vert_pth)
+    key  = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+    with _VERTICES_LOCK:
+        entry = _VERTICES.get(vert_pth)
+        if entry is None or entry[0] != key:
+            entry = _VERTICES[vert_pth] = (key, np.load(vert_pth, mmap_mode = 'r'))
+    return entry[1]
+
+def _polygon_ref(columns, position, path):
+    ''' Reference to polygons of annotation at position in
+        vertex store: (vertices path, list of (start, stop)).'''
+    po = columns['poly_offsets']
+    p0, p1 = columns['anno_offsets'][position], columns['anno_offsets'][position + 1]
+    digest = _mapped_digest(columns, path)
+    if digest is None:
+        raise ValueError(f'polygons are not mapped from vertex store {path}')
+    return (os.path.abspath(_vertex_store_path(path, 'vertices', digest)),
+            [(int(po[p]), int(po[p + 1])) for p in range(p0, p1)])
+
+def _resolve_segm(segm):
+    ''' Segmentation from polygon reference (see _polygon_ref),
+        vertices are sliced from memmap opened by this process;
+        other segmentations are returned as they are.'''
+    if not isinstance(segm, tuple): return segm
+    vert_pth, bounds = segm
+    vertices = _open_vertices(vert_pth)
+    return [_float32_exact(vertices[start:stop]) for start, stop in bounds]
@@ -0,0 +1,37 @@
+import os
+import json
+
+import pytest
+
+from labelutilits import Annotation
+
+ANNO_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                         'annotation.json')
+
+@pytest.fixture(scope = 'module')
+def anno():
+    return Annotation(ANNO_PATH, snapshot = False)
+
+@pytest.fixture(scope = 'module')
+def by_image(anno):
+    out = dict()
+    for ann in anno.data_dict()['annotations']:
+        out.setdefault(ann['image_id'], []).append(ann)
+    return out
+
+def test_getters_match_data_dict(anno, by_image):
+    for x in anno.data['images']:
+        expected = by_image.get(x['id'], [])
+        assert anno.get_annotations(x['id']) == expected
+        assert anno.get_segmentations(x['id']) == \
+               [poly for ann in expected for poly in ann['segmentation']]
+        assert anno.get_bboxes(x['id']) == [ann['bbox'] for ann in expected]
+
+def test_getters_match_source_json(anno):
+    with open(ANNO_PATH) as f:
+        source = json.load(f)['annotations']
+    by_id = {ann['id']:ann for ann in source}
+    for x in anno.data['images']:
+        for ann in anno.get_annotations(x['id']):
+            assert ann['bbox'] == by_id[ann['id']]['bbox']
+            assert ann['segmentation'] == by_id[ann['id']]['segmentation']